@@ -0,0 +1,670 @@
+import asyncio
+import collections
+import contextlib
+import copy
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+
+from historial import HistorialLog, claves_historial, fecha_iso
+
+COLECCIONES = ("puntos", "multas", "bans", "parties", "nombres", "asistencia", "resumen")
+VACIOS = {
+    "puntos": dict, "multas": dict, "bans": list, "parties": dict, "nombres": dict,
+    "asistencia": dict, "resumen": dict,
+}
+
+# ======================
+# ESCRITURA ATOMICA
+# ======================
+def leer_json(ruta, vacio):
+    if not os.path.exists(ruta):
+        return vacio()
+    with open(ruta, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def escribir_json_atomico(ruta, data):
+    # Se escribe en un temporal del mismo directorio y se renombra encima,
+    # asi un corte a mitad de escritura nunca deja el archivo truncado.
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directorio)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, ruta)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+# ======================
+# BACKEND JSON
+# ======================
+class BackendJSON:
+    # Cada archivo se reescribe entero, asi que el volcado necesita la coleccion completa
+    escritura_parcial = False
+
+    def __init__(self, archivos, historial_file):
+        self.archivos = archivos
+        self.historial = HistorialLog(historial_file, legado=historial_file)
+
+    def cargar(self, nombre):
+        return leer_json(self.archivos[nombre], VACIOS[nombre])
+
+    def escribir(self, nombre, data, claves=None):
+        # En JSON no hay escritura parcial: siempre se reescribe el archivo
+        escribir_json_atomico(self.archivos[nombre], data)
+
+    def agregar_historial(self, entry):
+        self.historial.agregar(entry)
+
+    def agregar_historial_lote(self, entries):
+        self.historial.agregar_lote(entries)
+
+    def contar_historial(self, filtro=None):
+        return self.historial.contar(filtro)
+
+    def leer_historial(self, pos, filtro=None):
+        # pos 0 es la party mas reciente
+        return self.historial.leer(pos, filtro)
+
+    def preparar_historial(self):
+        self.historial.preparar()
+
+    def iterar_historial(self):
+        return self.historial.iterar()
+
+    def cerrar(self):
+        self.historial.cerrar()
+
+# ======================
+# BACKEND SQLITE
+# ======================
+ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS puntos (
+    uid TEXT PRIMARY KEY,
+    puntos_actuales INTEGER NOT NULL DEFAULT 0,
+    puntos_obtenidos INTEGER NOT NULL DEFAULT 0,
+    puntos_usados INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS multas (
+    uid TEXT PRIMARY KEY,
+    deuda REAL NOT NULL DEFAULT 0,
+    total REAL NOT NULL DEFAULT 0,
+    pago REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS bans (
+    uid TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS nombres (
+    uid TEXT PRIMARY KEY,
+    nombre TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS parties (
+    msg_id TEXT PRIMARY KEY,
+    datos TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS asistencia (
+    uid TEXT PRIMARY KEY,
+    datos TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS resumen (
+    clave TEXT PRIMARY KEY,
+    datos TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS historial (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fecha_iso TEXT,
+    hora TEXT,
+    leader_id TEXT,
+    descuento INTEGER,
+    datos TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_historial_fecha ON historial (fecha_iso);
+CREATE INDEX IF NOT EXISTS idx_historial_leader ON historial (leader_id);
+CREATE TABLE IF NOT EXISTS historial_miembros (
+    historial_id INTEGER NOT NULL,
+    uid TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_historial_miembros_uid ON historial_miembros (uid, historial_id);
+"""
+
+CAMPOS_SQLITE = {
+    "puntos": ("puntos_actuales", "puntos_obtenidos", "puntos_usados"),
+    "multas": ("deuda", "total", "pago"),
+    "bans": (),
+    "nombres": ("nombre",),
+    # None: la fila guarda el documento entero como JSON
+    "parties": None,
+    "asistencia": None,
+    "resumen": None,
+}
+CLAVES_SQLITE = {"parties": "msg_id", "resumen": "clave"}
+# Consultas del historial por filtro: (origen, columna de orden, parametros).
+# El de miembro recorre su indice (uid, historial_id) de atras para adelante,
+# asi las ultimas N parties de alguien no dependen del largo del historial.
+FILTROS_SQLITE = {
+    None: ("historial", "historial.id", lambda valor: ()),
+    "leader": ("historial WHERE leader_id = ?", "historial.id", lambda valor: (valor,)),
+    "mes": ("historial WHERE fecha_iso BETWEEN ? AND ?", "historial.id", lambda valor: (valor + "-00", valor + "-99")),
+    "miembro": (
+        "historial_miembros JOIN historial ON historial.id = historial_miembros.historial_id "
+        "WHERE historial_miembros.uid = ?",
+        "historial_miembros.historial_id", lambda valor: (valor,)
+    ),
+}
+
+class BackendSQLite:
+    escritura_parcial = True
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        # La conexion se comparte con el hilo de volcado, siempre bajo el lock
+        self.conn = sqlite3.connect(ruta, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.executescript(ESQUEMA_SQLITE)
+        self.conn.commit()
+        self._completar_miembros()
+
+    def _completar_miembros(self):
+        # Bases creadas antes de la tabla historial_miembros: se llena una vez
+        # y user_version marca que ya se hizo
+        with self.lock, self.conn:
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] >= 1:
+                return
+            for historial_id, datos in self.conn.execute("SELECT id, datos FROM historial").fetchall():
+                self._indexar_miembros(historial_id, json.loads(datos))
+            self.conn.execute("PRAGMA user_version = 1")
+
+    def _indexar_miembros(self, historial_id, entry):
+        uids = {valor for tipo, valor in claves_historial(entry) if tipo == "miembro"}
+        self.conn.executemany(
+            "INSERT INTO historial_miembros (historial_id, uid) VALUES (?, ?)",
+            [(historial_id, uid) for uid in uids],
+        )
+
+    def cargar(self, nombre):
+        with self.lock:
+            return self._cargar(nombre)
+
+    def _cargar(self, nombre):
+        campos = CAMPOS_SQLITE[nombre]
+        clave = CLAVES_SQLITE.get(nombre, "uid")
+        if nombre == "bans":
+            return [uid for (uid,) in self.conn.execute("SELECT uid FROM bans ORDER BY rowid")]
+        if campos is None:
+            filas = self.conn.execute(f"SELECT {clave}, datos FROM {nombre}")
+            return {fila[0]: json.loads(fila[1]) for fila in filas}
+        filas = self.conn.execute(f"SELECT {clave}, {', '.join(campos)} FROM {nombre}")
+        return {fila[0]: dict(zip(campos, fila[1:])) for fila in filas}
+
+    def _upsert(self, nombre, uid, valor):
+        campos = CAMPOS_SQLITE[nombre]
+        clave = CLAVES_SQLITE.get(nombre, "uid")
+        if campos is None:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {nombre} ({clave}, datos) VALUES (?, ?)", (uid, json.dumps(valor))
+            )
+            return
+        if not campos:
+            self.conn.execute(f"INSERT OR IGNORE INTO {nombre} ({clave}) VALUES (?)", (uid,))
+            return
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO {nombre} ({clave}, {', '.join(campos)}) VALUES (?{', ?' * len(campos)})",
+            (uid, *(valor.get(c, 0) for c in campos)),
+        )
+
+    def escribir(self, nombre, data, claves=None):
+        # Con claves se tocan solo esas filas; sin claves se reemplaza la tabla
+        es_lista = isinstance(data, list)
+        presentes = set(data) if es_lista else data
+        with self.lock, self.conn:
+            if claves is None:
+                self.conn.execute(f"DELETE FROM {nombre}")
+                claves = data if es_lista else data.keys()
+            for uid in claves:
+                if uid in presentes:
+                    self._upsert(nombre, uid, None if es_lista else data[uid])
+                else:
+                    clave = CLAVES_SQLITE.get(nombre, "uid")
+                    self.conn.execute(f"DELETE FROM {nombre} WHERE {clave} = ?", (uid,))
+
+    def agregar_historial(self, entry):
+        self.agregar_historial_lote([entry])
+
+    def agregar_historial_lote(self, entries):
+        # Todo el lote en una sola transaccion
+        with self.lock, self.conn:
+            for entry in entries:
+                cursor = self.conn.execute(
+                    "INSERT INTO historial (fecha_iso, hora, leader_id, descuento, datos) VALUES (?, ?, ?, ?, ?)",
+                    (fecha_iso(entry.get("fecha")), entry.get("hora"), str(entry.get("leader_id")),
+                     entry.get("descuento", 0), json.dumps(entry)),
+                )
+                self._indexar_miembros(cursor.lastrowid, entry)
+
+    def _consulta(self, filtro):
+        tipo, valor = filtro if filtro is not None else (None, None)
+        origen, orden, parametros = FILTROS_SQLITE[tipo]
+        return origen, orden, parametros(valor)
+
+    def contar_historial(self, filtro=None):
+        origen, _, parametros = self._consulta(filtro)
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM {origen}", parametros).fetchone()[0]
+
+    def preparar_historial(self):
+        # Los filtros ya tienen sus indices en la base
+        pass
+
+    def leer_historial(self, pos, filtro=None):
+        origen, orden, parametros = self._consulta(filtro)
+        with self.lock:
+            fila = self.conn.execute(
+                f"SELECT historial.datos FROM {origen} ORDER BY {orden} DESC LIMIT 1 OFFSET ?", (*parametros, pos)
+            ).fetchone()
+        if fila is None:
+            raise IndexError(pos)
+        return json.loads(fila[0])
+
+    def iterar_historial(self, lote=500):
+        # Por tandas de id, para no tener el lock tomado durante toda la pasada
+        ultimo = 0
+        while True:
+            with self.lock:
+                filas = self.conn.execute(
+                    "SELECT id, datos FROM historial WHERE id > ? ORDER BY id LIMIT ?", (ultimo, lote)
+                ).fetchall()
+            if not filas:
+                return
+            for ultimo, datos in filas:
+                yield json.loads(datos)
+
+    def cerrar(self):
+        with self.lock:
+            self.conn.close()
+
+def migrar_json_a_sqlite(origen, destino):
+    # Migracion de una sola vez: copia las colecciones y el historial completo
+    for nombre in COLECCIONES:
+        destino.escribir(nombre, origen.cargar(nombre))
+    for entry in origen.iterar_historial():
+        destino.agregar_historial(entry)
+
+def crear_backend(tipo, archivos, historial_file, db_file):
+    if tipo == "sqlite":
+        nueva = not os.path.exists(db_file)
+        backend = BackendSQLite(db_file)
+        if nueva:
+            migrar_json_a_sqlite(BackendJSON(archivos, historial_file), backend)
+        return backend
+    return BackendJSON(archivos, historial_file)
+
+# ======================
+# TRANSACCIONES
+# ======================
+class Cerrojo:
+    # Compartido o exclusivo, concedido en orden de llegada: un exclusivo que
+    # espera frena a los compartidos que llegan despues y no queda postergado.
+    # Soltar es sincronico, asi se puede hacer en un finally aunque cancelen.
+    def __init__(self):
+        self.compartidos = 0
+        self.exclusivo = False
+        self.cola = collections.deque()
+
+    def ocupado(self):
+        return self.exclusivo or self.compartidos or bool(self.cola)
+
+    def _libre(self, exclusivo):
+        return not self.exclusivo and not (exclusivo and self.compartidos)
+
+    def _ocupar(self, exclusivo):
+        if exclusivo:
+            self.exclusivo = True
+        else:
+            self.compartidos += 1
+
+    async def tomar(self, exclusivo=True):
+        if not self.cola and self._libre(exclusivo):
+            self._ocupar(exclusivo)
+            return
+        futuro = asyncio.get_running_loop().create_future()
+        pedido = (exclusivo, futuro)
+        self.cola.append(pedido)
+        try:
+            await futuro
+        except BaseException:
+            if futuro.done() and not futuro.cancelled():
+                # Se concedio justo cuando cancelaban: se devuelve
+                self.soltar(exclusivo)
+            else:
+                self.cola.remove(pedido)
+                self._despertar()
+            raise
+
+    def soltar(self, exclusivo=True):
+        if exclusivo:
+            self.exclusivo = False
+        else:
+            self.compartidos -= 1
+        self._despertar()
+
+    def _despertar(self):
+        while self.cola and self._libre(self.cola[0][0]):
+            exclusivo, futuro = self.cola.popleft()
+            self._ocupar(exclusivo)
+            futuro.set_result(None)
+
+# ======================
+# ALMACEN EN MEMORIA
+# ======================
+class Almacen:
+    # Carga cada coleccion una sola vez, sirve las lecturas desde memoria y
+    # solo escribe a disco lo marcado como sucio cuando se llama a volcar().
+    # Con libro, las colecciones del libro se vuelven durables como registros
+    # agregados y al backend solo van cuando toca snapshot.
+    def __init__(self, backend, libro=None):
+        self.backend = backend
+        self.libro = libro
+        self.datos = {}
+        self.sucios = {}
+        for nombre in COLECCIONES:
+            self.datos[nombre] = backend.cargar(nombre)
+            self.sucios[nombre] = set()
+        self.completos = set()
+        if libro is not None:
+            for registro in libro.cola():
+                self._aplicar(registro)
+        self.indices = {nombre: [] for nombre in COLECCIONES}
+        # Sube con cada cambio; sirve de clave para caches de lo ya renderizado
+        self.versiones = dict.fromkeys(COLECCIONES, 0)
+        self.cerrojos = {nombre: Cerrojo() for nombre in COLECCIONES}
+        self.cerrojos_miembro = {}
+        self._proximo = None
+        self._tarea = None
+
+    def _aplicar(self, registro):
+        nombre, uid, valor = registro["c"], registro["u"], registro["v"]
+        if uid is None:
+            self.datos[nombre] = valor
+            self.completos.add(nombre)
+            return
+        if valor is None:
+            self.datos[nombre].pop(uid, None)
+        else:
+            self.datos[nombre][uid] = valor
+        self.sucios[nombre].add(uid)
+
+    def en_libro(self, nombre):
+        return self.libro is not None and nombre in self.libro.colecciones
+
+    def obtener(self, nombre):
+        return self.datos[nombre]
+
+    def version(self, nombre):
+        return self.versiones[nombre]
+
+    def registrar_indice(self, nombre, indice):
+        # Los indices se arman una vez y despues se actualizan por clave marcada
+        indice.reconstruir(self.datos[nombre])
+        self.indices[nombre].append(indice)
+        return indice
+
+    def reemplazar(self, nombre, data):
+        self.datos[nombre] = data
+        self.completos.add(nombre)
+        self.versiones[nombre] += 1
+        for indice in self.indices[nombre]:
+            indice.reconstruir(data)
+
+    def marcar(self, nombre, *claves):
+        if not claves:
+            self.completos.add(nombre)
+        else:
+            self.sucios[nombre].update(str(c) for c in claves)
+        self.versiones[nombre] += 1
+        for indice in self.indices[nombre]:
+            indice.actualizar(self.datos[nombre], claves or None)
+
+    def guardar(self, nombre, data, claves=None, delta=None, actor=None):
+        completo = claves is None or data is not self.datos[nombre]
+        if data is not self.datos[nombre]:
+            self.reemplazar(nombre, data)
+        elif claves is None:
+            self.marcar(nombre)
+        elif claves:
+            self.marcar(nombre, *claves)
+        if self.en_libro(nombre):
+            self._anotar(nombre, data, None if completo else claves, delta, actor)
+
+    def _anotar(self, nombre, data, claves, delta, actor):
+        if claves is None:
+            self.libro.anotar(nombre, None, {k: dict(v) for k, v in data.items()}, delta, actor)
+            return
+        for uid in claves:
+            valor = data.get(str(uid))
+            self.libro.anotar(nombre, str(uid), dict(valor) if valor is not None else None, delta, actor)
+
+    def snapshot_pendiente(self):
+        return self.libro is not None and self.libro.desde_snapshot >= self.libro.cada
+
+    def hay_cambios(self):
+        if self.libro is not None and (self.libro.pendientes or self.snapshot_pendiente()):
+            return True
+        return any(
+            (nombre in self.completos or self.sucios[nombre]) and not self.en_libro(nombre)
+            for nombre in COLECCIONES
+        )
+
+    def _copiar(self, nombre, valor):
+        if CAMPOS_SQLITE[nombre] is None:
+            return copy.deepcopy(valor)
+        return dict(valor) if isinstance(valor, dict) else valor
+
+    def preparar_volcado(self, snapshot=False):
+        # Corre en el event loop: copia solo lo que hay que escribir para que
+        # el hilo de volcado no lea estructuras que se siguen modificando.
+        # El seq del snapshot se toma junto con la copia de las colecciones.
+        snapshot = self.libro is not None and (snapshot or self.snapshot_pendiente())
+        lote = []
+        registros = self.libro.tomar() if self.libro is not None else []
+        marca = None
+        if snapshot:
+            marca = self.libro.seq
+            self.libro.desde_snapshot = 0
+        for nombre in COLECCIONES:
+            if self.en_libro(nombre) and not snapshot:
+                continue
+            data = self.datos[nombre]
+            if nombre in self.completos or (self.sucios[nombre] and not self.backend.escritura_parcial):
+                claves = None
+                if isinstance(data, list):
+                    copia = list(data)
+                else:
+                    copia = {k: self._copiar(nombre, v) for k, v in data.items()}
+            elif self.sucios[nombre]:
+                claves = list(self.sucios[nombre])
+                if isinstance(data, list):
+                    presentes = set(data)
+                    copia = [k for k in claves if k in presentes]
+                else:
+                    copia = {k: self._copiar(nombre, data[k]) for k in claves if k in data}
+            else:
+                continue
+            lote.append((nombre, copia, claves, nombre in self.completos, set(self.sucios[nombre])))
+            self.sucios[nombre].clear()
+            self.completos.discard(nombre)
+        return lote, registros, marca
+
+    def _escribir_lote(self, volcado):
+        # Primero el libro: un snapshot nunca queda adelante de su propio libro
+        lote, registros, marca = volcado
+        if self.libro is not None:
+            self.libro.escribir(registros)
+        for nombre, copia, claves, _, _ in lote:
+            self.backend.escribir(nombre, copia, claves)
+        if marca is not None:
+            self.libro.rotar(marca)
+
+    def _restaurar_lote(self, volcado):
+        # Si la escritura fallo, lo del lote vuelve a quedar sucio para el proximo
+        # intento; los registros se reescriben y al leer se descartan por seq
+        lote, registros, marca = volcado
+        if self.libro is not None:
+            self.libro.devolver(registros)
+            if marca is not None:
+                self.libro.desde_snapshot = self.libro.cada
+        for nombre, _, _, completo, sucios in lote:
+            if completo:
+                self.completos.add(nombre)
+            self.sucios[nombre].update(sucios)
+
+    def volcar(self, snapshot=False):
+        volcado = self.preparar_volcado(snapshot)
+        try:
+            self._escribir_lote(volcado)
+        except BaseException:
+            self._restaurar_lote(volcado)
+            raise
+
+    async def persistir(self):
+        # Los pedidos que llegan mientras hay un volcado en curso se juntan en
+        # el siguiente, y la serializacion y escritura corren en otro hilo.
+        if self._proximo is None:
+            self._proximo = asyncio.get_running_loop().create_future()
+            if self._tarea is None or self._tarea.done():
+                self._tarea = asyncio.create_task(self._bucle_volcado())
+        await asyncio.shield(self._proximo)
+
+    @contextlib.asynccontextmanager
+    async def transaccion(self, **claves):
+        # transaccion(puntos=[uid, ...], bans=[uid]); None toma la coleccion
+        # entera. Las de miembros distintos corren en paralelo y las que se
+        # cruzan se ejecutan de a una. Todo se toma en un orden fijo (primero
+        # colecciones, despues miembros) para que nunca se esperen en cruz.
+        # Si el cuerpo falla se vuelve a lo que habia; si no, se persiste
+        # antes de soltar, asi nadie lee un cambio que no llego a disco.
+        pedidos = {
+            nombre: None if uids is None else sorted({str(uid) for uid in uids})
+            for nombre, uids in claves.items()
+        }
+        tomados = []
+        try:
+            for nombre in sorted(pedidos):
+                exclusivo = pedidos[nombre] is None
+                await self.cerrojos[nombre].tomar(exclusivo)
+                tomados.append((self.cerrojos[nombre], exclusivo, None))
+            for clave in sorted((nombre, uid) for nombre, uids in pedidos.items() for uid in uids or ()):
+                cerrojo = self.cerrojos_miembro.setdefault(clave, Cerrojo())
+                try:
+                    await cerrojo.tomar()
+                except BaseException:
+                    self._descartar_cerrojo(clave)
+                    raise
+                tomados.append((cerrojo, True, clave))
+
+            previos = {nombre: self._preimagen(nombre, uids) for nombre, uids in pedidos.items()}
+            try:
+                yield
+            except BaseException:
+                for nombre, uids in pedidos.items():
+                    self._deshacer(nombre, uids, previos[nombre])
+                raise
+            await self.persistir()
+        finally:
+            for cerrojo, exclusivo, clave in reversed(tomados):
+                cerrojo.soltar(exclusivo)
+                if clave is not None:
+                    self._descartar_cerrojo(clave)
+
+    def _descartar_cerrojo(self, clave):
+        cerrojo = self.cerrojos_miembro.get(clave)
+        if cerrojo is not None and not cerrojo.ocupado():
+            del self.cerrojos_miembro[clave]
+
+    def _preimagen(self, nombre, uids):
+        data = self.datos[nombre]
+        if uids is None:
+            return copy.deepcopy(data)
+        if isinstance(data, list):
+            presentes = set(data)
+            return {uid: uid in presentes for uid in uids}
+        return {uid: copy.deepcopy(data.get(uid)) for uid in uids}
+
+    def _deshacer(self, nombre, uids, previo):
+        data = self.datos[nombre]
+        if uids is None:
+            if data != previo:
+                self.guardar(nombre, previo)
+            return
+        cambiados = []
+        for uid, valor in previo.items():
+            if isinstance(data, list):
+                if (uid in data) == valor:
+                    continue
+                if valor:
+                    data.append(uid)
+                else:
+                    data.remove(uid)
+            elif data.get(uid) != valor:
+                if valor is None:
+                    data.pop(uid, None)
+                else:
+                    data[uid] = valor
+            else:
+                continue
+            cambiados.append(uid)
+        if cambiados:
+            self.guardar(nombre, data, cambiados)
+
+    async def _bucle_volcado(self):
+        while self._proximo is not None:
+            futuro, self._proximo = self._proximo, None
+            volcado = self.preparar_volcado()
+            try:
+                await asyncio.to_thread(self._escribir_lote, volcado)
+            except Exception as e:
+                self._restaurar_lote(volcado)
+                futuro.set_exception(e)
+            else:
+                futuro.set_result(None)
+
+    def agregar_historial(self, entry):
+        self.backend.agregar_historial(entry)
+
+    async def agregar_historial_async(self, entry):
+        await asyncio.to_thread(self.backend.agregar_historial, entry)
+
+    def agregar_historial_lote(self, entries):
+        self.backend.agregar_historial_lote(entries)
+
+    def contar_historial(self, filtro=None):
+        # filtro: None o (tipo, valor) con tipo "leader", "mes" o "miembro"
+        return self.backend.contar_historial(filtro)
+
+    def leer_historial(self, pos, filtro=None):
+        return self.backend.leer_historial(pos, filtro)
+
+    # Un filtro puede tener que armar su indice o ir a la base: desde el loop
+    # se consulta en un hilo
+    async def contar_historial_async(self, filtro=None):
+        return await asyncio.to_thread(self.backend.contar_historial, filtro)
+
+    async def leer_historial_async(self, pos, filtro=None):
+        return await asyncio.to_thread(self.backend.leer_historial, pos, filtro)
+
+    def preparar_historial(self):
+        self.backend.preparar_historial()
+
+    def iterar_historial(self):
+        return self.backend.iterar_historial()
+
+    def cerrar(self):
+        self.volcar(snapshot=True)
+        self.backend.cerrar()
+        if self.libro is not None:
+            self.libro.cerrar()
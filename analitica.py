@@ -0,0 +1,46 @@
+# ======================
+# AGREGADOS DE ASISTENCIA
+# ======================
+# Se suman una vez por party finalizada, asi las estadisticas de un miembro
+# o del gremio salen de buscar una clave y nunca de recorrer el historial.
+def asistencia_vacia():
+    return {"parties": 0, "lideradas": 0, "puntos_gastados": 0, "roles": {}, "ultima": None}
+
+def resumen_vacio():
+    return {"parties": 0, "asistencias": 0, "puntos_gastados": 0, "roles": {}}
+
+def sumar_party(asistencia, resumen, entry):
+    # Devuelve los uids tocados para marcar solo esas filas
+    gremio = resumen.setdefault("gremio", resumen_vacio())
+    gremio["parties"] += 1
+    descuento = entry.get("descuento", 0)
+    # El historial viejo no guarda a quienes se desconto: se asume que a todos
+    descontados = entry.get("descontados")
+    tocados = set()
+
+    for rol, miembros in entry.get("roles", {}).items():
+        for m in miembros:
+            uid = str(m["id"])
+            datos = asistencia.setdefault(uid, asistencia_vacia())
+            datos["parties"] += 1
+            datos["roles"][rol] = datos["roles"].get(rol, 0) + 1
+            datos["ultima"] = entry.get("fecha")
+            gremio["asistencias"] += 1
+            gremio["roles"][rol] = gremio["roles"].get(rol, 0) + 1
+            if descontados is None or uid in descontados:
+                datos["puntos_gastados"] += descuento
+                gremio["puntos_gastados"] += descuento
+            tocados.add(uid)
+
+    lider = str(entry.get("leader_id"))
+    asistencia.setdefault(lider, asistencia_vacia())["lideradas"] += 1
+    tocados.add(lider)
+    return tocados
+
+def reconstruir_agregados(entries):
+    # Una sola pasada por el historial, de la party mas vieja a la mas nueva
+    asistencia = {}
+    resumen = {"gremio": resumen_vacio()}
+    for entry in entries:
+        sumar_party(asistencia, resumen, entry)
+    return asistencia, resumen
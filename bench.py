@@ -0,0 +1,258 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# ======================
+# MICROBENCHMARKS
+# ======================
+# Uso: python bench.py [--salida bench_resultados.json] [--rapido]
+# Mide los caminos calientes de bot.py contra gremios e historiales generados.
+
+TAMANOS_GREMIO = [100, 1000, 10000]
+TAMANOS_HISTORIAL = [10, 1000, 10000]
+MIEMBROS_PARTY = 40
+GUILD_ID = 1
+
+class CanalFalso:
+    def __init__(self, canal_id, name):
+        self.id = canal_id
+        self.name = name
+
+class GuildFalso:
+    def __init__(self, guild_id, roles):
+        self.id = guild_id
+        self.text_channels = [CanalFalso(1000 + i, f"b-{rol}") for i, rol in enumerate(roles)]
+
+    def get_member(self, member_id):
+        return None
+
+class MensajeFalso:
+    def __init__(self, msg_id, guild):
+        self.id = msg_id
+        self.guild = guild
+        self.channel = guild.text_channels[0]
+        self.ediciones = 0
+
+    async def edit(self, **kwargs):
+        self.ediciones += 1
+
+def generar_puntos(cantidad, rng):
+    puntos = {}
+    for i in range(cantidad):
+        obtenidos = rng.randint(0, 500)
+        usados = rng.randint(0, obtenidos)
+        puntos[str(100000 + i)] = {
+            "puntos_actuales": obtenidos - usados,
+            "puntos_obtenidos": obtenidos,
+            "puntos_usados": usados,
+        }
+    return puntos
+
+def generar_party(bot, uids, rng):
+    party_data = {
+        "leader_id": 1,
+        "hora": "1800",
+        "fecha": "18/10/2026",
+        "_roster": bot.Roster(bot.WB_ROLES),
+        "cerrada": False,
+        "iniciada": True,
+        "descuento": 3,
+        "guild_id": GUILD_ID,
+        "canal_id": 1,
+    }
+    for uid in rng.sample(uids, min(MIEMBROS_PARTY, len(uids))):
+        rol = rng.choice(bot.WB_ROLES)
+        party_data["_roster"].agregar(int(uid), f"Miembro {uid}", rol, bot.puntos_actuales_de(GUILD_ID, uid))
+    return party_data
+
+def abrir_particion(bot, backend, prefijo):
+    # Cada caso arranca con una particion vacia en su propio directorio
+    bot.almacenes.clear()
+    bot.rankings.clear()
+    bot.DATOS_DIR = tempfile.mkdtemp(prefix=prefijo)
+    bot.STORAGE = backend
+    return bot.almacen_de(GUILD_ID)
+
+def reabrir_particion(bot):
+    # La misma particion como recien arrancado el bot: sin nada armado en memoria
+    bot.almacenes.pop(GUILD_ID).cerrar()
+    bot.rankings.clear()
+    return bot.almacen_de(GUILD_ID)
+
+def anotar(resultados, nombre, params, tiempos, repeticiones):
+    resultados.append({
+        "nombre": nombre,
+        "params": params,
+        "repeticiones": repeticiones,
+        "min_us": round(min(tiempos), 2),
+        "mediana_us": round(statistics.median(tiempos), 2),
+        "media_us": round(statistics.fmean(tiempos), 2),
+    })
+    print(f"{nombre:<32} {json.dumps(params):<40} mediana {resultados[-1]['mediana_us']:>12.2f} us")
+
+def medir(resultados, nombre, params, fn, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - inicio) * 1e6)
+    anotar(resultados, nombre, params, tiempos, repeticiones)
+
+async def medir_async(resultados, nombre, params, fn, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        await fn()
+        tiempos.append((time.perf_counter() - inicio) * 1e6)
+    anotar(resultados, nombre, params, tiempos, repeticiones)
+
+# ======================
+# CASOS
+# ======================
+def bench_almacen(bot, resultados, rng, repeticiones):
+    for backend in ("json", "sqlite"):
+        for cantidad in TAMANOS_GREMIO:
+            almacen = abrir_particion(bot, backend, f"bench-{backend}-{cantidad}-")
+            puntos = generar_puntos(cantidad, rng)
+            bot.guardar_puntos(GUILD_ID, puntos)
+            almacen.volcar()
+            uids = list(puntos)
+            params = {"backend": backend, "miembros": cantidad}
+
+            medir(resultados, "cargar_puntos", params, lambda: bot.cargar_puntos(GUILD_ID), repeticiones)
+
+            def guardar_uno():
+                uid = rng.choice(uids)
+                data = bot.cargar_puntos(GUILD_ID)
+                data[uid]["puntos_actuales"] += 1
+                bot.guardar_puntos(GUILD_ID, data, [uid])
+                almacen.volcar()
+            medir(resultados, "guardar_puntos+volcar", params, guardar_uno, repeticiones)
+            almacen.cerrar()
+
+async def bench_historial(bot, resultados, rng, repeticiones):
+    for backend in ("json", "sqlite"):
+        for cantidad in TAMANOS_HISTORIAL:
+            almacen = abrir_particion(bot, backend, f"bench-historial-{backend}-{cantidad}-")
+            bot.guardar_puntos(GUILD_ID, generar_puntos(100, rng))
+            uids = list(bot.cargar_puntos(GUILD_ID))
+            party_data = generar_party(bot, uids, rng)
+            entry = bot.datos_party(party_data)
+            for _ in range(cantidad):
+                almacen.agregar_historial(entry)
+            params = {"backend": backend, "parties": cantidad}
+
+            await medir_async(resultados, "guardar_historial", params,
+                              lambda: bot.guardar_historial(party_data), repeticiones)
+            medir(resultados, "leer_historial", params,
+                  lambda: almacen.leer_historial(rng.randrange(cantidad)), repeticiones)
+            # Ultimas 20 parties de un miembro via el indice secundario
+            filtro = ("miembro", str(next(iter(party_data["_roster"].por_miembro))))
+            almacen.contar_historial(filtro)
+            medir(resultados, "historial de un miembro (20)", params,
+                  lambda: [almacen.leer_historial(pos, filtro) for pos in range(min(20, almacen.contar_historial(filtro)))],
+                  repeticiones)
+
+            # Primera consulta filtrada despues de abrir la particion: incluye
+            # esperar el indice secundario, que se arma en un hilo al cargarla
+            tiempos = []
+            for _ in range(min(repeticiones, 5)):
+                almacen = reabrir_particion(bot)
+                inicio = time.perf_counter()
+                await almacen.contar_historial_async(filtro)
+                tiempos.append((time.perf_counter() - inicio) * 1e6)
+            anotar(resultados, "historial filtrado (en frio)", params, tiempos, len(tiempos))
+            almacen.cerrar()
+
+async def bench_render(bot, resultados, rng, repeticiones):
+    guild = GuildFalso(GUILD_ID, bot.WB_ROLES)
+    bot.construir_canales_roles(guild)
+    for cantidad in TAMANOS_GREMIO:
+        abrir_particion(bot, "json", f"bench-render-{cantidad}-")
+        ranking_obtenidos = bot.ranking_de(GUILD_ID, "puntos_obtenidos")
+        ranking_actuales = bot.ranking_de(GUILD_ID, "puntos_actuales")
+        bot.guardar_puntos(GUILD_ID, generar_puntos(cantidad, rng))
+        uids = list(bot.cargar_puntos(GUILD_ID))
+        params = {"miembros": cantidad, "party": MIEMBROS_PARTY}
+
+        party_data = generar_party(bot, uids, rng)
+        embed = bot.construir_embed_party(guild, party_data)
+        medir(resultados, "renderizar_embed", params,
+              lambda: bot.renderizar_embed(guild, party_data, embed), repeticiones)
+        medir(resultados, "renderizar_embed (cache)", params,
+              lambda: bot.renderizar_embed(guild, party_data, embed, 1), repeticiones)
+
+        # Rafaga de reacciones sobre el mismo mensaje: cuenta cuantas ediciones salen
+        bot.editor_embeds.ventana = 0.01
+        msg = MensajeFalso(2, guild)
+        bot.wb_parties[msg.id] = party_data
+        inicio = time.perf_counter()
+        for _ in range(20):
+            await bot.actualizar_embed(msg, party_data, embed)
+        await asyncio.sleep(0.05)
+        resultados.append({
+            "nombre": "actualizar_embed (rafaga de 20)",
+            "params": params,
+            "ediciones": msg.ediciones,
+            "total_us": round((time.perf_counter() - inicio) * 1e6, 2),
+        })
+        del bot.wb_parties[msg.id]
+        bot.editor_embeds.olvidar(msg.id)
+
+        medir(resultados, "ranking (top 10)", params, lambda: ranking_obtenidos.top(10), repeticiones)
+        medir(resultados, "scores (pagina)", params,
+              lambda: ranking_actuales.rango(rng.randrange(max(1, cantidad // 10)) * 10, 10), repeticiones)
+        medir(resultados, "ranking (sort completo)", params,
+              lambda: sorted(bot.cargar_puntos(GUILD_ID).items(), key=lambda item: item[1].get("puntos_obtenidos", 0),
+                             reverse=True), repeticiones)
+
+        # Las parties se arman antes: armar el roster no es parte de finalizar
+        parties = iter([generar_party(bot, uids, rng) for _ in range(repeticiones)])
+        medir(resultados, "Finalizar (descontar_puntos)", params, lambda: bot.descontar_puntos(next(parties)), repeticiones)
+
+# ======================
+# MAIN
+# ======================
+async def correr(bot, repeticiones):
+    rng = random.Random(1234)
+    resultados = []
+    bench_almacen(bot, resultados, rng, repeticiones)
+    await bench_historial(bot, resultados, rng, repeticiones)
+    await bench_render(bot, resultados, rng, repeticiones)
+    return resultados
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks de almacenamiento y render de bot.py")
+    parser.add_argument("--salida", default="bench_resultados.json")
+    parser.add_argument("--repeticiones", type=int, default=50)
+    parser.add_argument("--rapido", action="store_true", help="solo los tamaños chicos")
+    args = parser.parse_args()
+
+    if args.rapido:
+        del TAMANOS_GREMIO[1:]
+        del TAMANOS_HISTORIAL[1:]
+
+    salida = os.path.abspath(args.salida)
+    # bot.py abre sus archivos relativos al directorio actual al importarse
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(tempfile.mkdtemp(prefix="bench-bot-"))
+    import bot
+
+    resultados = asyncio.run(correr(bot, args.repeticiones))
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump({
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "resultados": resultados,
+        }, f, indent=2)
+    print(f"Resultados en {salida}")
+
+if __name__ == "__main__":
+    main()
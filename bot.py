@@ -1,8 +1,24 @@
+import asyncio
 import discord
-import json
+import functools
+import logging
 import os
-from discord.ext import commands
-from discord.ui import View, Button
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from discord.ext import commands, tasks
+from discord.ui import View, Button, Select
+from almacen import Almacen, crear_backend, escribir_json_atomico, leer_json
+from analitica import asistencia_vacia, reconstruir_agregados, resumen_vacio, sumar_party
+from indices import IndiceEstado, IndiceRanking, Roster
+from libro import Libro
+from metricas import Metricas, instrumentar_http, muestrear_lag
+from paginador import CachePaginas, FuentePaginas, Paginador
+from salida import Planificador, PRIORIDAD_DECORATIVA, PRIORIDAD_INTERACCION, PRIORIDAD_ROSTER
+from temporizador import RuedaTemporizadores
+
+log = logging.getLogger(__name__)
+
 # =======================
 # CONFIGURACIÓN EMBEBIDA
 # =======================
@@ -14,17 +30,24 @@ ROLE_MEMBER = os.getenv("ROL_MIEMBRO")
 # ======================
 # DECORADORES DE CHECKS
 # ======================
+def es_lider(member):
+    nombre = config_de(member.guild.id)["rol_capitan"]
+    return any(role.name == nombre for role in member.roles)
+
+def es_miembro(member):
+    nombre = config_de(member.guild.id)["rol_miembro"]
+    return any(role.name == nombre for role in member.roles)
+
 def es_party_leader():
     def predicate(ctx):
-        if any(role.name == ROLE_PARTY_LEADER for role in ctx.author.roles):
+        if es_lider(ctx.author):
             return True
-        raise commands.CheckFailure(f"⛔ No tenés el rol necesario ({ROLE_PARTY_LEADER}) para usar este comando.")
+        raise commands.CheckFailure(f"⛔ No tenés el rol necesario ({config_de(ctx.guild.id)['rol_capitan']}) para usar este comando.")
     return commands.check(predicate)
 
 def es_member_o_leader():
     def predicate(ctx):
-        nombres_roles = [role.name for role in ctx.author.roles]
-        if ROLE_PARTY_LEADER in nombres_roles or ROLE_MEMBER in nombres_roles:
+        if es_lider(ctx.author) or es_miembro(ctx.author):
             return True
         raise commands.CheckFailure(f"⛔ Solo miembros o líderes pueden usar este comando.")
     return commands.check(predicate)
@@ -38,154 +61,665 @@ intents.guilds = True
 intents.members = True
 intents.reactions = True
 
-bot = commands.Bot(command_prefix=PREFIJO, intents=intents)
+class Contexto(commands.Context):
+    # Las respuestas de los comandos tambien salen por el planificador
+    async def send(self, content=None, **kwargs):
+        return await salida.enviar(("canal", self.channel.id), PRIORIDAD_INTERACCION, super().send, content=content, **kwargs)
+
+# SHARDS=auto (o la cantidad de shards) usa AutoShardedBot; SHARD_IDS reparte
+# los shards entre varios procesos, cada uno con sus guilds y sus particiones.
+SHARDS = os.getenv("SHARDS")
+SHARD_IDS = os.getenv("SHARD_IDS")
+opciones_shards = {}
+if SHARD_IDS and not SHARDS:
+    raise SystemExit("SHARD_IDS necesita SHARDS con la cantidad total de shards (ejemplo: SHARDS=4 SHARD_IDS=0,1).")
+if SHARD_IDS and SHARDS == "auto":
+    raise SystemExit("SHARDS=auto no se puede combinar con SHARD_IDS: poné en SHARDS la cantidad total de shards.")
+if SHARDS and SHARDS != "auto":
+    opciones_shards["shard_count"] = int(SHARDS)
+if SHARD_IDS:
+    opciones_shards["shard_ids"] = [int(i) for i in SHARD_IDS.split(",")]
+    if any(not 0 <= i < opciones_shards["shard_count"] for i in opciones_shards["shard_ids"]):
+        raise SystemExit(f"SHARD_IDS tiene que estar entre 0 y {opciones_shards['shard_count'] - 1}.")
+
+def guild_propio(guild_id):
+    # Discord manda cada guild al shard (guild_id >> 22) % shard_count; sin
+    # SHARD_IDS este proceso tiene todos los shards
+    if "shard_ids" not in opciones_shards:
+        return True
+    return (int(guild_id) >> 22) % opciones_shards["shard_count"] in opciones_shards["shard_ids"]
+
+class BotWB(commands.AutoShardedBot if SHARDS else commands.Bot):
+    async def get_context(self, origin, /, *, cls=None):
+        return await super().get_context(origin, cls=cls or Contexto)
+
+    async def setup_hook(self):
+        # Las particiones con parties abiertas se cargan antes de conectar para
+        # que sus botones respondan apenas llega el primer evento
+        for guild_id in particiones_en_disco():
+            almacen_de(guild_id)
+        if GUILD_LEGADO and guild_propio(GUILD_LEGADO):
+            almacen_de(GUILD_LEGADO)
+        instrumentar_http(self.http, metricas)
+        tareas_fondo.add(asyncio.create_task(muestrear_lag(metricas)))
+        tareas_fondo.add(temporizadores.iniciar())
+        if METRICAS_PUERTO:
+            await metricas.servir(METRICAS_HOST, int(METRICAS_PUERTO), metricas_extra)
+
+def prefijo_de(bot, message):
+    if message.guild is None:
+        return PREFIJO
+    return config_de(message.guild.id)["prefijo"]
+
+# Con MIEMBROS_LAZY=1 no se piden todos los miembros de cada guild al conectar:
+# los nombres salen del directorio persistido y lo que falte se pide por lotes.
+MIEMBROS_LAZY = os.getenv("MIEMBROS_LAZY") == "1"
+
+bot = BotWB(command_prefix=prefijo_de, intents=intents, chunk_guilds_at_startup=not MIEMBROS_LAZY, **opciones_shards)
+metricas = Metricas()
+METRICAS_HOST = os.getenv("METRICAS_HOST", "127.0.0.1")
+METRICAS_PUERTO = os.getenv("METRICAS_PUERTO")
+# Referencias a las tareas de fondo para que no las junte el GC
+tareas_fondo = set()
+# Toda escritura a Discord pasa por aca: una cola por bucket (canal o
+# interaccion) y dentro de cada una primero respuestas, despues rosters y
+# al final las reacciones decorativas.
+salida = Planificador()
+
+def editar_mensaje(msg, prioridad, **kwargs):
+    # Una edicion pendiente del mismo mensaje se reemplaza por la mas nueva
+    return salida.programar(("canal", msg.channel.id), prioridad, msg.edit, ("edit", msg.id), **kwargs)
+
+async def responder(interaction, accion, **kwargs):
+    # Las respuestas van por el webhook de la interaccion: no esperan al canal
+    return await salida.enviar(("interaccion", interaction.id), PRIORIDAD_INTERACCION, accion, **kwargs)
+
+def evento(coro):
+    # Registra el handler en el bot midiendo su latencia
+    return bot.event(metricas.medir("evento")(coro))
+
+@bot.before_invoke
+async def inicio_comando(ctx):
+    ctx.inicio_metricas = time.perf_counter()
+
+@bot.after_invoke
+async def fin_comando(ctx):
+    inicio = getattr(ctx, "inicio_metricas", None)
+    if inicio is not None:
+        metricas.observar("comando", ctx.command.qualified_name, (time.perf_counter() - inicio) * 1000)
 
 SCORES_FILE = "_scores.json"
 HISTORIAL_FILE = "_historial_parties.json"
 MULTAS_FILE = "_multas.json"
 BANS_FILE = "_bans.json"
+PARTIES_FILE = "_parties_abiertas.json"
+NOMBRES_FILE = "_nombres.json"
+ASISTENCIA_FILE = "_asistencia.json"
+RESUMEN_FILE = "_resumen_gremio.json"
+# Libro de movimientos de puntos y multas: cada cuantos registros se hace snapshot
+MOVIMIENTOS_DIR = "_movimientos"
+SNAPSHOT_CADA = int(os.getenv("SNAPSHOT_CADA", "1000"))
+MOVIMIENTOS_POR_CONSULTA = 15
+DB_FILE = os.getenv("DB_FILE", "_datos.sqlite3")
+STORAGE = os.getenv("STORAGE", "json")
+INTERVALO_VOLCADO = int(os.getenv("INTERVALO_VOLCADO", "10"))
+VENTANA_EDICION = float(os.getenv("VENTANA_EDICION", "0.75"))
+# Ciclo de vida de las parties, en minutos: aviso a los anotados antes de la
+# hora, cierre automatico despues de la hora y cuanto sigue en memoria una
+# party ya cerrada (para que terminen las ediciones en vuelo)
+AVISO_ANTES = float(os.getenv("AVISO_ANTES", "15"))
+CIERRE_AUTOMATICO = float(os.getenv("CIERRE_AUTOMATICO", "180"))
+DESALOJO = float(os.getenv("DESALOJO", "1"))
+# Embeds de paginas ya renderizadas (scores, historial) y vida de cada paginador
+CACHE_PAGINAS = int(os.getenv("CACHE_PAGINAS", "256"))
+TIMEOUT_PAGINADOR = float(os.getenv("TIMEOUT_PAGINADOR", "180"))
+# Cada guild tiene su particion en DATOS_DIR/<guild_id>/ que se carga y se
+# vuelca por separado. Los archivos de antes de particionar (en la raiz) los
+# adopta GUILD_LEGADO o, si no esta definido, el unico guild del bot.
+DATOS_DIR = os.getenv("DATOS_DIR", "datos")
+GUILD_LEGADO = os.getenv("GUILD_LEGADO")
+CONFIG_FILE = "_config.json"
+# Config de antes de guardarla en cada particion: un archivo para todos los guilds
+CONFIG_GUILDS_FILE = os.path.join(DATOS_DIR, "_config_guilds.json")
+# guild_id -> Almacen
+almacenes = {}
+# guild_id -> {campo: IndiceRanking}
+rankings = {}
+# guild_id -> IndiceEstado (puntos, deuda y ban de cada miembro)
+estados = {}
+# guild_id -> config propia del guild (solo las claves que se cambiaron)
+configs = {}
 wb_parties = {}
 WB_ROLES = ["maintank", "offtank", "healer", "pajaro", "perma", "maldi", "fuego", "montura", "scout"]
 REACTIONS = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣"]
+ROL_POR_CANAL = {f"b-{rol}": rol for rol in WB_ROLES}
+# Como se anotan los miembros en las parties nuevas: "reacciones", "menu" o "botones"
+MODO_INSCRIPCION = os.getenv("MODO_INSCRIPCION", "reacciones")
+# guild_id -> {rol: id del canal b-<rol>}
+canales_roles = {}
 
 # ======================
-# FUNCIONES UTILES
+# PARTICIONES POR GUILD
 # ======================
-def cargar_puntos():
-    if not os.path.exists(SCORES_FILE):
-        return {}
-    with open(SCORES_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def guardar_puntos(data):
-    with open(SCORES_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-
-def guardar_historial(data):
-    if os.path.exists(HISTORIAL_FILE):
-        with open(HISTORIAL_FILE, "r", encoding="utf-8") as f:
-            historial = json.load(f)
+def archivos_legado():
+    raiz, _ = os.path.splitext(HISTORIAL_FILE)
+    nombres = [SCORES_FILE, MULTAS_FILE, BANS_FILE, PARTIES_FILE, HISTORIAL_FILE, raiz + ".jsonl", raiz + ".idx", DB_FILE]
+    return [nombre for nombre in nombres if os.path.exists(nombre)]
+
+if archivos_legado() and not GUILD_LEGADO and SHARD_IDS:
+    raise SystemExit("Hay archivos de antes de particionar y SHARD_IDS reparte los guilds: definí GUILD_LEGADO con el guild que los adopta.")
+
+class LegadoSinDueno(RuntimeError):
+    pass
+
+def guild_legado():
+    # Sin GUILD_LEGADO solo se adivina cuando el bot ya conoce todos sus
+    # guilds y es uno solo
+    if GUILD_LEGADO:
+        return int(GUILD_LEGADO)
+    if not bot.is_ready():
+        raise LegadoSinDueno("Hay archivos de antes de particionar: se adoptan cuando el bot esta listo.")
+    if len(bot.guilds) != 1:
+        raise LegadoSinDueno("Hay archivos de antes de particionar y el bot esta en varios guilds: definí GUILD_LEGADO.")
+    return bot.guilds[0].id
+
+def crear_particion(guild_id, directorio):
+    # Se decide antes de crear el directorio: si no se sabe de quien es el
+    # legado no queda una particion vacia que despues no lo adopte
+    legado = archivos_legado()
+    adoptar = bool(legado) and guild_id == guild_legado()
+    os.makedirs(directorio)
+    if adoptar:
+        for nombre in legado:
+            os.replace(nombre, os.path.join(directorio, os.path.basename(nombre)))
+
+def almacen_de(guild_id):
+    guild_id = int(guild_id)
+    almacen = almacenes.get(guild_id)
+    if almacen is not None:
+        return almacen
+
+    directorio = os.path.join(DATOS_DIR, str(guild_id))
+    if not os.path.isdir(directorio):
+        crear_particion(guild_id, directorio)
+
+    def ruta(nombre):
+        return os.path.join(directorio, os.path.basename(nombre))
+
+    almacen = Almacen(crear_backend(
+        STORAGE,
+        {
+            "puntos": ruta(SCORES_FILE), "multas": ruta(MULTAS_FILE), "bans": ruta(BANS_FILE),
+            "parties": ruta(PARTIES_FILE), "nombres": ruta(NOMBRES_FILE),
+            "asistencia": ruta(ASISTENCIA_FILE), "resumen": ruta(RESUMEN_FILE),
+        },
+        ruta(HISTORIAL_FILE),
+        ruta(DB_FILE),
+    ), Libro(ruta(MOVIMIENTOS_DIR), cada=SNAPSHOT_CADA))
+    configs[guild_id] = cargar_config(guild_id, ruta(CONFIG_FILE))
+    rankings[guild_id] = {
+        campo: almacen.registrar_indice("puntos", IndiceRanking(campo))
+        for campo in ("puntos_obtenidos", "puntos_actuales")
+    }
+    rankings[guild_id]["parties"] = almacen.registrar_indice("asistencia", IndiceRanking("parties"))
+    estados[guild_id] = IndiceEstado()
+    for nombre in ("puntos", "multas", "bans"):
+        almacen.registrar_indice(nombre, estados[guild_id].vista(nombre))
+    almacen.registrar_indice("puntos", OrdenRosters(guild_id))
+    # Cada party del historial se cuenta una vez en el resumen: si no coinciden
+    # (primera carga, o un corte entre el historial y el volcado) se rearman
+    if almacen.obtener("resumen").get("gremio", resumen_vacio())["parties"] != almacen.contar_historial():
+        reconstruir_asistencia(almacen)
+    almacenes[guild_id] = almacen
+    restaurar_parties(guild_id)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
     else:
-        historial = []
-    historial.insert(0, data)
-    with open(HISTORIAL_FILE, "w", encoding="utf-8") as f:
-        json.dump(historial, f, indent=2)
-
-def cargar_multas():
-    if not os.path.exists(MULTAS_FILE):
-        return {}
-    with open(MULTAS_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def guardar_multas(data):
-    with open(MULTAS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-
-def cargar_bans():
-    if not os.path.exists(BANS_FILE):
+        # Los indices por filtro del historial se arman en un hilo, no en el
+        # primer !wbhistorial filtrado
+        tarea = asyncio.create_task(asyncio.to_thread(almacen.preparar_historial))
+        tareas_fondo.add(tarea)
+        tarea.add_done_callback(tareas_fondo.discard)
+    return almacen
+
+@metricas.medir("almacen")
+def reconstruir_asistencia(almacen):
+    asistencia, resumen = reconstruir_agregados(almacen.iterar_historial())
+    almacen.reemplazar("asistencia", asistencia)
+    almacen.reemplazar("resumen", resumen)
+
+def ranking_de(guild_id, campo):
+    almacen_de(guild_id)
+    return rankings[int(guild_id)][campo]
+
+def estado_de(guild_id):
+    almacen_de(guild_id)
+    return estados[int(guild_id)]
+
+def particiones_en_disco():
+    # Solo las de los guilds de este proceso: las demas son de otro proceso,
+    # que es el unico que las abre, restaura sus parties y las vuelca
+    if not os.path.isdir(DATOS_DIR):
         return []
-    with open(BANS_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return [int(nombre) for nombre in os.listdir(DATOS_DIR) if nombre.isdigit() and guild_propio(nombre)]
+
+@metricas.medir("almacen", "volcado")
+async def volcar_almacenes():
+    await asyncio.gather(*(almacen.persistir() for almacen in list(almacenes.values()) if almacen.hay_cambios()))
+
+# ======================
+# CONFIG POR GUILD
+# ======================
+# Cada guild guarda su config en su particion, asi cada proceso escribe solo
+# la de sus guilds y no pisa la de otro
+CLAVES_CONFIG = ("prefijo", "rol_capitan", "rol_miembro")
+
+def cargar_config(guild_id, ruta_config):
+    if os.path.exists(ruta_config):
+        return leer_json(ruta_config, dict)
+    # La del archivo compartido de antes se copia una vez a la particion
+    config = leer_json(CONFIG_GUILDS_FILE, dict).get(str(guild_id), {})
+    if config:
+        escribir_json_atomico(ruta_config, config)
+    return config
+
+def config_de(guild_id):
+    almacen_de(guild_id)
+    config = {"prefijo": PREFIJO, "rol_capitan": ROLE_PARTY_LEADER, "rol_miembro": ROLE_MEMBER}
+    config.update(configs[int(guild_id)])
+    return config
+
+async def guardar_config(guild_id, **cambios):
+    almacen_de(guild_id)
+    config = configs[int(guild_id)]
+    config.update(cambios)
+    ruta_config = os.path.join(DATOS_DIR, str(int(guild_id)), CONFIG_FILE)
+    await asyncio.to_thread(escribir_json_atomico, ruta_config, dict(config))
+
+# ======================
+# DIRECTORIO DE NOMBRES
+# ======================
+# query_members acepta hasta 100 ids por pedido
+LOTE_CONSULTA_MIEMBROS = 100
+# (guild_id, uid) que ya se consultaron sin resultado en esta sesion
+miembros_ausentes = set()
+
+def recordar_nombre(member):
+    if member is None or member.bot or getattr(member, "guild", None) is None:
+        return
+    almacen = almacen_de(member.guild.id)
+    nombres = almacen.obtener("nombres")
+    uid = str(member.id)
+    if nombres.get(uid, {}).get("nombre") != member.display_name:
+        nombres[uid] = {"nombre": member.display_name}
+        almacen.marcar("nombres", uid)
+
+async def nombres_de(guild, uids):
+    # Primero la cache de discord.py, despues el directorio, y los que falten
+    # se piden al gateway en lotes en vez de uno por uno
+    nombres = almacen_de(guild.id).obtener("nombres")
+    resultado = {}
+    faltantes = []
+    for uid in uids:
+        uid = str(uid)
+        member = guild.get_member(int(uid))
+        if member is not None:
+            recordar_nombre(member)
+            resultado[uid] = member.display_name
+        elif uid in nombres:
+            resultado[uid] = nombres[uid]["nombre"]
+        elif (guild.id, uid) not in miembros_ausentes:
+            faltantes.append(int(uid))
+
+    for i in range(0, len(faltantes), LOTE_CONSULTA_MIEMBROS):
+        lote = faltantes[i:i + LOTE_CONSULTA_MIEMBROS]
+        try:
+            encontrados = await guild.query_members(user_ids=lote, cache=False)
+        except (asyncio.TimeoutError, discord.ClientException):
+            break
+        for member in encontrados:
+            recordar_nombre(member)
+            resultado[str(member.id)] = member.display_name
+        miembros_ausentes.update((guild.id, str(uid)) for uid in lote if str(uid) not in resultado)
+    return resultado
+
+# ======================
+# FUNCIONES UTILES
+# ======================
+@metricas.medir("almacen")
+def cargar_puntos(guild_id):
+    return almacen_de(guild_id).obtener("puntos")
+
+@metricas.medir("almacen")
+def guardar_puntos(guild_id, data, claves=None, delta=None, actor=None):
+    almacen_de(guild_id).guardar("puntos", data, claves, delta, actor)
+
+def ajustar_puntos(data, valor):
+    # Suma o resta como !score: lo positivo cuenta como obtenido, lo negativo como usado
+    data["puntos_actuales"] += valor
+    if valor >= 0:
+        data["puntos_obtenidos"] += valor
+    else:
+        data["puntos_usados"] += abs(valor)
 
-def guardar_bans(data):
-    with open(BANS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+def ajustar_multa(data, valor):
+    # Positivo suma deuda; negativo es un pago, que nunca deja la deuda abajo de 0
+    if valor >= 0:
+        data["deuda"] += valor
+        data["total"] += valor
+    else:
+        data["deuda"] += valor
+        data["pago"] += abs(valor)
+        if data["deuda"] < 0:
+            data["pago"] += data["deuda"]
+            data["deuda"] = 0.0
+
+def puntos_actuales_de(guild_id, uid):
+    return estado_de(guild_id).estado(uid)[0]
+
+def reordenar_rosters(guild_id, claves=None):
+    for party_data in wb_parties.values():
+        roster = party_data.get("_roster")
+        if roster is None or party_data["cerrada"] or party_data["guild_id"] != guild_id:
+            continue
+        for miembro_id in [int(uid) for uid in claves] if claves is not None else list(roster.por_miembro):
+            roster.reordenar(miembro_id, puntos_actuales_de(guild_id, miembro_id))
+
+class OrdenRosters:
+    # Se registra como un indice mas de puntos, despues del de estado: todo
+    # cambio de puntos reordena los rosters abiertos, tambien el de una
+    # transaccion que se deshace o el del libro al recuperar
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+
+    def reconstruir(self, data):
+        reordenar_rosters(self.guild_id)
+
+    def actualizar(self, data, claves=None):
+        reordenar_rosters(self.guild_id, claves)
+
+def datos_party(party_data):
+    # Las claves con "_" son referencias en memoria (mensaje, embed, roster) que no se persisten
+    datos = {k: v for k, v in party_data.items() if not k.startswith("_")}
+    if "_roster" in party_data:
+        datos["roles"] = party_data["_roster"].como_dict()
+    return datos
+
+@metricas.medir("almacen")
+async def guardar_historial(data):
+    await almacen_de(data["guild_id"]).agregar_historial_async(datos_party(data))
+
+@metricas.medir("almacen")
+def registrar_asistencia(party_data):
+    almacen = almacen_de(party_data["guild_id"])
+    tocados = sumar_party(almacen.obtener("asistencia"), almacen.obtener("resumen"), datos_party(party_data))
+    almacen.marcar("asistencia", *tocados)
+    almacen.marcar("resumen", "gremio")
+
+@metricas.medir("almacen")
+def cargar_parties(guild_id):
+    return almacen_de(guild_id).obtener("parties")
+
+@metricas.medir("almacen")
+def cargar_multas(guild_id):
+    return almacen_de(guild_id).obtener("multas")
+
+@metricas.medir("almacen")
+def guardar_multas(guild_id, data, claves=None, delta=None, actor=None):
+    almacen_de(guild_id).guardar("multas", data, claves, delta, actor)
+
+@metricas.medir("almacen")
+def cargar_bans(guild_id):
+    return almacen_de(guild_id).obtener("bans")
+
+@metricas.medir("almacen")
+def guardar_bans(guild_id, data, claves=None):
+    almacen_de(guild_id).guardar("bans", data, claves)
+
+@tasks.loop(seconds=INTERVALO_VOLCADO)
+async def volcado_periodico():
+    if any(almacen.hay_cambios() for almacen in almacenes.values()):
+        await volcar_almacenes()
+
+def construir_canales_roles(guild):
+    canales = {}
+    for canal in guild.text_channels:
+        rol = ROL_POR_CANAL.get(canal.name)
+        if rol and rol not in canales:
+            canales[rol] = canal.id
+    canales_roles[guild.id] = canales
+    return canales
+
+def enlace_canal_rol(guild, rol):
+    canales = canales_roles.get(guild.id)
+    if canales is None:
+        canales = construir_canales_roles(guild)
+    canal_id = canales.get(rol)
+    return f"https://discord.com/channels/{guild.id}/{canal_id}" if canal_id else None
+
+@evento
+async def on_ready():
+    if archivos_legado() and not GUILD_LEGADO and len(bot.guilds) > 1:
+        log.error("Hay archivos de antes de particionar y el bot esta en varios guilds: definí GUILD_LEGADO.")
+        await bot.close()
+        return
+    for guild in bot.guilds:
+        construir_canales_roles(guild)
+        almacen_de(guild.id)
+    if not volcado_periodico.is_running():
+        volcado_periodico.start()
+
+@evento
+async def on_guild_join(guild):
+    construir_canales_roles(guild)
+    almacen_de(guild.id)
+
+@evento
+async def on_message(message):
+    if message.guild is not None and isinstance(message.author, discord.Member):
+        recordar_nombre(message.author)
+    await bot.process_commands(message)
+
+@evento
+async def on_member_join(member):
+    recordar_nombre(member)
+
+@evento
+async def on_member_update(before, after):
+    if before.display_name != after.display_name:
+        recordar_nombre(after)
+
+@evento
+async def on_guild_channel_create(channel):
+    rol = ROL_POR_CANAL.get(channel.name)
+    if not rol or not isinstance(channel, discord.TextChannel):
+        return
+    canales = canales_roles.setdefault(channel.guild.id, {})
+    canales.setdefault(rol, channel.id)
+
+@evento
+async def on_guild_channel_delete(channel):
+    canales = canales_roles.get(channel.guild.id)
+    rol = ROL_POR_CANAL.get(channel.name)
+    if canales is not None and rol and canales.get(rol) == channel.id:
+        # Puede haber otro canal con el mismo nombre que pase a ser el del rol
+        construir_canales_roles(channel.guild)
+
+@evento
+async def on_guild_channel_update(before, after):
+    if before.name == after.name:
+        return
+    if before.name in ROL_POR_CANAL or after.name in ROL_POR_CANAL:
+        construir_canales_roles(after.guild)
 
 async def generar_campos_embed(embed, guild):
     for i, rol in enumerate(WB_ROLES):
-        canal_name = f"b-{rol}"
-        canal = discord.utils.get(guild.text_channels, name=canal_name)
-        canal_link = f"(https://discord.com/channels/{guild.id}/{canal.id})" if canal else "[N/A]"
+        enlace = enlace_canal_rol(guild, rol)
+        canal_link = f"({enlace})" if enlace else "[N/A]"
 
         new_title = f"{REACTIONS[i]} {rol.capitalize()}\n{canal_link}"
         embed.add_field(name=new_title, value="—", inline=True)
 
-async def actualizar_embed(msg, party_data, embed):
-    puntos = cargar_puntos()
-    multas = cargar_multas()
-    bans = cargar_bans()
+# ======================
+# EDICION DE EMBEDS
+# ======================
+# Firma del contenido de cada campo ya renderizado, por (mensaje, indice)
+campos_renderizados = {}
+
+def renderizar_embed(guild, party_data, embed, msg_id=None):
+    # Una busqueda por miembro en el indice de estado, que ban, multa y
+    # score mantienen al dia
+    estado = estado_de(guild.id).estados
+    vacio = IndiceEstado.VACIO
+
+    roster = party_data["_roster"]
 
     for i, rol in enumerate(WB_ROLES):
-        miembros_texto = []
-        for m in sorted(party_data["roles"][rol], key=lambda x: puntos.get(str(x['id']), {}).get('puntos_actuales', 0), reverse=True):
-            uid = str(m['id'])
-            deuda = multas.get(uid, {}).get("deuda", 0.0)
-            tiene_ban = uid in bans
+        miembros = []
+        # El roster ya mantiene cada rol ordenado por puntos
+        for miembro_id, nombre in roster.miembros(rol):
+            puntos_actuales, deuda, tiene_ban = estado.get(str(miembro_id), vacio)
+            miembros.append((nombre, puntos_actuales, deuda > 0 or tiene_ban))
+
+        canal_link = enlace_canal_rol(guild, rol) or "[N/A]"
 
-            nombre = m['nombre']
-            puntos_actuales = puntos.get(uid, {}).get('puntos_actuales', 0)
+        # El texto del campo solo se vuelve a armar si cambio su contenido
+        clave = hash((canal_link, tuple(miembros)))
+        if msg_id is not None and campos_renderizados.get((msg_id, i)) == clave:
+            continue
 
-            if deuda > 0 or tiene_ban:
+        miembros_texto = []
+        for nombre, puntos_actuales, marcado in miembros:
+            if marcado:
                 miembros_texto.append(f"```diff\n- {nombre} ({puntos_actuales})```")
             else:
                 miembros_texto.append(f"{nombre} ({puntos_actuales})")
 
         texto = "\n".join(miembros_texto) if miembros_texto else "—"
-
-        canal_name = f"b-{rol}"
-        canal = discord.utils.get(msg.guild.text_channels, name=canal_name)
-        canal_link = f"https://discord.com/channels/{msg.guild.id}/{canal.id}" if canal else "[N/A]"
-
         new_title = f"{REACTIONS[i]} {rol.capitalize()}\n{canal_link}"
+        if msg_id is not None:
+            campos_renderizados[(msg_id, i)] = clave
         embed.set_field_at(i, name=new_title, value=texto, inline=True)
 
-    await msg.edit(embed=embed)
+def firma_embed(embed):
+    return hash((embed.title, embed.description, tuple((f.name, f.value) for f in embed.fields)))
+
+class EditorEmbeds:
+    # Junta las ediciones de un mismo mensaje que llegan dentro de la ventana
+    # en una sola, con el ultimo estado, y omite las que no cambian nada.
+    def __init__(self, ventana):
+        self.ventana = ventana
+        self.pendientes = {}
+        self.tareas = {}
+        self.enviados = {}
+        self.stats = {"encoladas": 0, "fusionadas": 0, "omitidas": 0, "enviadas": 0}
+
+    def programar(self, msg, party_data, embed):
+        self.stats["encoladas"] += 1
+        if msg.id in self.pendientes:
+            self.stats["fusionadas"] += 1
+        self.pendientes[msg.id] = (msg, party_data, embed)
+        if msg.id not in self.tareas:
+            self.tareas[msg.id] = asyncio.create_task(self._editar_luego(msg.id))
+
+    def registrar(self, msg_id, embed):
+        # Para ediciones hechas por fuera del editor (botones de control)
+        self.enviados[msg_id] = firma_embed(embed)
+
+    def olvidar(self, msg_id):
+        self.enviados.pop(msg_id, None)
+        self.pendientes.pop(msg_id, None)
+        for i in range(len(WB_ROLES)):
+            campos_renderizados.pop((msg_id, i), None)
+
+    async def _editar_luego(self, msg_id):
+        try:
+            await asyncio.sleep(self.ventana)
+            pendiente = self.pendientes.pop(msg_id, None)
+        finally:
+            self.tareas.pop(msg_id, None)
+        if pendiente is None:
+            # La party se finalizo mientras la edicion esperaba
+            return
+        msg, party_data, embed = pendiente
+
+        renderizar_embed(msg.guild, party_data, embed, msg_id)
+        firma = firma_embed(embed)
+        if self.enviados.get(msg_id) == firma:
+            self.stats["omitidas"] += 1
+            return
+        self.enviados[msg_id] = firma
+        self.stats["enviadas"] += 1
+        await editar_mensaje(msg, PRIORIDAD_ROSTER, embed=embed)
+
+editor_embeds = EditorEmbeds(VENTANA_EDICION)
+paginas_renderizadas = CachePaginas(CACHE_PAGINAS)
+
+async def actualizar_embed(msg, party_data, embed):
+    editor_embeds.programar(msg, party_data, embed)
 
-@bot.event
+@evento
 async def on_raw_reaction_add(payload):
     if payload.message_id not in wb_parties:
         return
 
     guild = bot.get_guild(payload.guild_id)
-    member = guild.get_member(payload.user_id)
-    if member.bot:
+    # El add trae el miembro en el payload aunque no este en cache
+    member = payload.member or guild.get_member(payload.user_id)
+    if member is None or member.bot:
         return
 
     party_data = wb_parties[payload.message_id]
-    if party_data["cerrada"]:
+    if party_data["cerrada"] or party_data.get("inscripcion", "reacciones") != "reacciones":
         return
 
-    puntos = cargar_puntos()
-    uid = str(member.id)
-    puntos.setdefault(uid, {"puntos_actuales": 0, "puntos_obtenidos": 0, "puntos_usados": 0})
-
     try:
         idx = REACTIONS.index(str(payload.emoji))
     except ValueError:
         return
 
     rol_name = WB_ROLES[idx]
+    recordar_nombre(member)
 
-    for r in WB_ROLES:
-        party_data["roles"][r] = [u for u in party_data["roles"][r] if u["id"] != member.id]
-
-    party_data["roles"][rol_name].append({"id": member.id, "nombre": member.display_name})
+    # agregar() saca al miembro del rol anterior si ya estaba anotado
+    party_data["_roster"].agregar(member.id, member.display_name, rol_name, puntos_actuales_de(guild.id, member.id))
 
-    channel = guild.get_channel(payload.channel_id)
-    msg = await channel.fetch_message(payload.message_id)
-    embed = msg.embeds[0]
+    guardar_party(payload.message_id)
+    msg, embed = handles_party(payload.message_id, party_data)
     await actualizar_embed(msg, party_data, embed)
 
-@bot.event
+@evento
 async def on_raw_reaction_remove(payload):
     if payload.message_id not in wb_parties:
         return
 
     guild = bot.get_guild(payload.guild_id)
+    # El remove no trae el miembro; los bots nunca entran al roster, asi que
+    # si no esta en cache alcanza con el id
     member = guild.get_member(payload.user_id)
-    if member.bot:
+    if member is not None and member.bot:
         return
 
     party_data = wb_parties[payload.message_id]
-    if party_data["cerrada"]:
+    if party_data["cerrada"] or party_data.get("inscripcion", "reacciones") != "reacciones":
         return
 
-    for r in WB_ROLES:
-        party_data["roles"][r] = [u for u in party_data["roles"][r] if u["id"] != member.id]
+    try:
+        idx = REACTIONS.index(str(payload.emoji))
+    except ValueError:
+        return
 
-    channel = guild.get_channel(payload.channel_id)
-    msg = await channel.fetch_message(payload.message_id)
-    embed = msg.embeds[0]
+    # Al cambiar de rol llega primero el add nuevo y despues el remove viejo:
+    # solo se saca al miembro si la reaccion quitada es la de su rol actual.
+    roster = party_data["_roster"]
+    if roster.rol_de(payload.user_id) != WB_ROLES[idx]:
+        return
+    roster.quitar(payload.user_id)
+
+    guardar_party(payload.message_id)
+    msg, embed = handles_party(payload.message_id, party_data)
     await actualizar_embed(msg, party_data, embed)
 
 # ======================
@@ -194,69 +728,89 @@ async def on_raw_reaction_remove(payload):
 @bot.command()
 @es_party_leader()
 async def ban(ctx, member: discord.Member):
-    bans = cargar_bans()
     uid = str(member.id)
-
-    if uid in bans:
-        return await ctx.send(f"⚠️ {member.display_name} ya está baneado.")
-
-    bans.append(uid)
-    guardar_bans(bans)
+    async with almacen_de(ctx.guild.id).transaccion(bans=[uid]):
+        bans = cargar_bans(ctx.guild.id)
+        if uid in bans:
+            return await ctx.send(f"⚠️ {member.display_name} ya está baneado.")
+
+        bans.append(uid)
+        guardar_bans(ctx.guild.id, bans, [uid])
+    recordar_nombre(member)
     await ctx.send(f"🚫 {member.display_name} ha sido baneado.")
 
 @bot.command()
 @es_party_leader()
 async def unban(ctx, member: discord.Member):
-    bans = cargar_bans()
     uid = str(member.id)
+    async with almacen_de(ctx.guild.id).transaccion(bans=[uid]):
+        bans = cargar_bans(ctx.guild.id)
+        if uid not in bans:
+            return await ctx.send(f"⚠️ {member.display_name} no está baneado.")
 
-    if uid not in bans:
-        return await ctx.send(f"⚠️ {member.display_name} no está baneado.")
-
-    bans.remove(uid)
-    guardar_bans(bans)
+        bans.remove(uid)
+        guardar_bans(ctx.guild.id, bans, [uid])
     await ctx.send(f"✅ {member.display_name} ha sido desbaneado.")
 
 @bot.command()
 async def bans(ctx):
-    bans = cargar_bans()
+    bans = cargar_bans(ctx.guild.id)
 
     if not bans:
         return await ctx.send("✅ No hay usuarios baneados.")
 
     embed = discord.Embed(title="🚫 Lista de Baneados", color=discord.Color.dark_red())
 
+    nombres = await nombres_de(ctx.guild, bans)
     for uid in bans:
-        member = ctx.guild.get_member(int(uid))
-        nombre = member.display_name if member else "Usuario desconocido"
+        nombre = nombres.get(uid, "Usuario desconocido")
         embed.add_field(name=nombre, value=f"ID: {uid}", inline=False)
 
     await ctx.send(embed=embed)
 
+def filtro_historial(consulta):
+    # "@leader", "member:@usuario" (o "miembro:") y "YYYY-MM"
+    consulta = consulta.strip()
+    m = re.fullmatch(r"(?:member|miembro):\s*(?:<@!?(\d+)>|(\d+))", consulta)
+    if m:
+        return ("miembro", m.group(1) or m.group(2))
+    m = re.fullmatch(r"<@!?(\d+)>", consulta)
+    if m:
+        return ("leader", m.group(1))
+    if re.fullmatch(r"\d{4}-\d{2}", consulta):
+        return ("mes", consulta)
+    return None
+
+async def describir_filtro(guild, filtro):
+    # Los footers no renderizan menciones: se muestra el nombre
+    tipo, valor = filtro
+    if tipo == "mes":
+        return f"Mes {valor}"
+    nombre = (await nombres_de(guild, [valor])).get(valor, valor)
+    return f"{'Líder' if tipo == 'leader' else 'Miembro'} {nombre}"
+
 @bot.command(name="wbhistorial")
 @es_party_leader()
-async def wb_historial(ctx):
-    if not os.path.exists(HISTORIAL_FILE):
-        return await ctx.send("❌ No hay historial disponible.")
-
-    with open(HISTORIAL_FILE, "r", encoding="utf-8") as f:
-        historial = json.load(f)
-
-    if not historial:
-        return await ctx.send("❌ Historial vacío.")
-
-    paginas = [historial[i:i+1] for i in range(0, len(historial), 1)]
-    total_paginas = len(paginas)
-    index = 0
-
-    def crear_embed(entry, num_pagina):
+async def wb_historial(ctx, *, consulta: str = None):
+    almacen = almacen_de(ctx.guild.id)
+    filtro = None
+    if consulta:
+        filtro = filtro_historial(consulta)
+        if filtro is None:
+            return await ctx.send("❌ Filtro inválido. Usá `@leader`, `member:@usuario` o `YYYY-MM`.")
+    if not await almacen.contar_historial_async(filtro):
+        return await ctx.send("❌ Historial vacío." if filtro is None else "❌ No hay parties que coincidan.")
+
+    async def crear_embed(index):
+        entry = await almacen.leer_historial_async(index, filtro)
+        total_paginas = await almacen.contar_historial_async(filtro)
         hora = entry['hora']
         fecha = entry.get('fecha', 'Sin fecha')
         leader_id = entry.get("leader_id", "?")
         descuento = entry.get("descuento", 0)
 
         embed = discord.Embed(
-            title=f"Party WB - {hora[:2]}:{hora[2:]} UTC | {fecha} {num_pagina}/{total_paginas}",
+            title=f"Party WB - {hora[:2]}:{hora[2:]} UTC | {fecha} {index + 1}/{total_paginas}",
             color=discord.Color.orange()
         )
         embed.add_field(name="Líder de Party", value=f"<@{leader_id}>", inline=False)
@@ -273,84 +827,61 @@ async def wb_historial(ctx):
             texto = "No hubo miembros."
 
         embed.add_field(name="Miembros", value=texto, inline=False)
+        if filtro is not None:
+            embed.set_footer(text=f"Filtro: {descripcion}")
         return embed
 
-    view = View()
-
-    async def actualizar(mensaje):
-        await mensaje.edit(embed=crear_embed(paginas[index][0], index + 1), view=view)
-
-    class Anterior(Button):
-        def __init__(self):
-            super().__init__(label="⬅️ Anterior", style=discord.ButtonStyle.primary)
-        async def callback(self, interaction):
-            nonlocal index
-            if index > 0:
-                index -= 1
-                await actualizar(interaction.message)
-                await interaction.response.defer()
-
-    class Siguiente(Button):
-        def __init__(self):
-            super().__init__(label="➡️ Siguiente", style=discord.ButtonStyle.primary)
-        async def callback(self, interaction):
-            nonlocal index
-            if index < len(paginas)-1:
-                index += 1
-                await actualizar(interaction.message)
-                await interaction.response.defer()
-
-    view.add_item(Anterior())
-    view.add_item(Siguiente())
+    descripcion = await describir_filtro(ctx.guild, filtro) if filtro is not None else None
 
-    await ctx.send(embed=crear_embed(paginas[index][0], index + 1), view=view)
+    # El historial solo crece: la cantidad total de entradas alcanza como version
+    fuente = FuentePaginas(
+        ("historial", ctx.guild.id, filtro), lambda: almacen.contar_historial(filtro),
+        almacen.contar_historial, crear_embed
+    )
+    await Paginador(fuente, paginas_renderizadas, responder, editar_mensaje, TIMEOUT_PAGINADOR).enviar(ctx)
 
 @bot.command()
 async def comandos(ctx):
+    prefijo = config_de(ctx.guild.id)["prefijo"]
     embed = discord.Embed(title="📜 Lista de Comandos", color=discord.Color.green())
 
-    embed.add_field(name=f"{PREFIJO}score", value="[Miembros] [Líderes] | Ver tus puntos actuales. [Líderes] pueden usar: !score @usuario X para sumar/restar puntos.", inline=False)
-    embed.add_field(name=f"{PREFIJO}scores", value="[Miembros] | Ver ranking completo del gremio con paginación.", inline=False)
-    embed.add_field(name=f"{PREFIJO}ranking", value="[Miembros] | Ver el top 10 de puntos obtenidos.", inline=False)
-    embed.add_field(name=f"{PREFIJO}wb [hora]", value="[Líderes] | Crear party WB. Ejemplo: !wb 1800.", inline=False)
-    embed.add_field(name=f"{PREFIJO}wbhistorial", value="[Líderes] | Ver historial de parties anteriores.", inline=False)
-    embed.add_field(name=f"{PREFIJO}multa", value="[Miembros] | Ver tu propia deuda actual.", inline=False)
-    embed.add_field(name=f"{PREFIJO}multa @usuario <monto>", value="[Líderes] | Sumar/restar deuda a un usuario. Ejemplo: !multa @user 1.5 o !multa @user -3.", inline=False)
-    embed.add_field(name=f"{PREFIJO}multas", value="[Líderes] | Ver lista completa de multas.", inline=False)
-    embed.add_field(name=f"{PREFIJO}ban @usuario", value="[Líderes] | Banear un usuario.", inline=False)
-    embed.add_field(name=f"{PREFIJO}unban @usuario", value="[Líderes] | Desbanear un usuario.", inline=False)
-    embed.add_field(name=f"{PREFIJO}bans", value="[Miembros] | Ver lista de usuarios baneados.", inline=False)
-    embed.add_field(name=f"{PREFIJO}scorereset", value="[Líderes] | Reinicia todos los puntajes del gremio y deja a todos en 0.", inline=False)
-    embed.add_field(name=f"{PREFIJO}prefix <nuevo_prefijo>", value="[Líderes] | Cambiar el prefijo del bot. Ejemplo: !prefix ?", inline=False)
+    embed.add_field(name=f"{prefijo}score", value="[Miembros] [Líderes] | Ver tus puntos actuales. [Líderes] pueden usar: !score @usuario X para sumar/restar puntos.", inline=False)
+    embed.add_field(name=f"{prefijo}scores", value="[Miembros] | Ver ranking completo del gremio con paginación.", inline=False)
+    embed.add_field(name=f"{prefijo}ranking", value="[Miembros] | Ver el top 10 de puntos obtenidos.", inline=False)
+    embed.add_field(name=f"{prefijo}wb [hora]", value="[Líderes] | Crear party WB a la hora UTC (HHMM). Avisa a los anotados antes, arranca sola a la hora y se cierra sola si nadie la finaliza. Ejemplo: !wb 1800.", inline=False)
+    embed.add_field(name=f"{prefijo}wbhistorial [@leader | member:@usuario | YYYY-MM]", value="[Líderes] | Ver historial de parties anteriores, opcionalmente filtrado.", inline=False)
+    embed.add_field(name=f"{prefijo}multa", value="[Miembros] | Ver tu propia deuda actual.", inline=False)
+    embed.add_field(name=f"{prefijo}multa @usuario <monto>", value="[Líderes] | Sumar/restar deuda a un usuario. Ejemplo: !multa @user 1.5 o !multa @user -3.", inline=False)
+    embed.add_field(name=f"{prefijo}multas", value="[Líderes] | Ver lista completa de multas.", inline=False)
+    embed.add_field(name=f"{prefijo}ban @usuario", value="[Líderes] | Banear un usuario.", inline=False)
+    embed.add_field(name=f"{prefijo}unban @usuario", value="[Líderes] | Desbanear un usuario.", inline=False)
+    embed.add_field(name=f"{prefijo}bans", value="[Miembros] | Ver lista de usuarios baneados.", inline=False)
+    embed.add_field(name=f"{prefijo}movimientos [@usuario]", value="[Líderes] | Ver los últimos cambios de puntos y multas, con quién los hizo.", inline=False)
+    embed.add_field(name=f"{prefijo}scorereset", value="[Líderes] | Reinicia todos los puntajes del gremio y deja a todos en 0.", inline=False)
+    embed.add_field(name=f"{prefijo}prefix <nuevo_prefijo>", value="[Líderes] | Cambiar el prefijo del bot. Ejemplo: !prefix ?", inline=False)
+    embed.add_field(name=f"{prefijo}config [clave] [valor]", value="[Líderes] | Ver o cambiar la config del servidor (prefijo, rol_capitan, rol_miembro).", inline=False)
+    embed.add_field(name=f"{prefijo}stats", value="[Líderes] | Ver métricas de latencia, llamadas a la API y lag del bot.", inline=False)
+    embed.add_field(name=f"{prefijo}stats @usuario", value="[Líderes] | Ver asistencia, roles jugados y puntos gastados de un miembro.", inline=False)
+    embed.add_field(name=f"{prefijo}resumen", value="[Líderes] | Ver la asistencia total del gremio, reparto de roles y los más presentes.", inline=False)
 
     await ctx.send(embed=embed)
 
 @bot.command()
 async def multa(ctx, member: discord.Member = None, valor: float = None):
-    multas = cargar_multas()
+    multas = cargar_multas(ctx.guild.id)
 
     if member and valor is not None:
         # Check manual: solo líderes pueden modificar
-        if not any(role.name == ROLE_PARTY_LEADER for role in ctx.author.roles):
-            return await ctx.send(f"⛔ Solo los líderes ({ROLE_PARTY_LEADER}) pueden modificar multas.")
+        if not es_lider(ctx.author):
+            return await ctx.send(f"⛔ Solo los líderes ({config_de(ctx.guild.id)['rol_capitan']}) pueden modificar multas.")
         
         uid = str(member.id)
-        data = multas.get(uid, {"deuda": 0.0, "total": 0.0, "pago": 0.0})
-
-        if valor >= 0:
-            data["deuda"] += valor
-            data["total"] += valor
-        else:
-            pago_realizado = abs(valor)
-            data["deuda"] += valor
-            data["pago"] += pago_realizado
-
-            if data["deuda"] < 0:
-                data["pago"] += data["deuda"]
-                data["deuda"] = 0.0
-
-        multas[uid] = data
-        guardar_multas(multas)
+        async with almacen_de(ctx.guild.id).transaccion(multas=[uid]):
+            multas = cargar_multas(ctx.guild.id)
+            data = multas.get(uid, {"deuda": 0.0, "total": 0.0, "pago": 0.0})
+            ajustar_multa(data, valor)
+            multas[uid] = data
+            guardar_multas(ctx.guild.id, multas, [uid], valor, ctx.author.id)
         return await ctx.send(f"✅ Multa actualizada para {member.mention}. Deuda: {data['deuda']:.2f}")
 
     elif not member and valor is None:
@@ -374,150 +905,455 @@ async def multa(ctx, member: discord.Member = None, valor: float = None):
 @bot.command()
 @es_party_leader()
 async def multas(ctx):
-    multas = cargar_multas()
+    multas = cargar_multas(ctx.guild.id)
 
     if not multas:
         return await ctx.send("❌ No hay multas registradas.")
 
     embed = discord.Embed(title="📄 Lista de Multas", color=discord.Color.blue())
 
+    nombres = await nombres_de(ctx.guild, multas)
     for uid, data in multas.items():
-        member = ctx.guild.get_member(int(uid))
-        if member:
-            nombre = member.display_name
-        else:
-            nombre = "Usuario desconocido"
+        nombre = nombres.get(uid, "Usuario desconocido")
 
         valor = f"Deuda: {data['deuda']:.2f} | Total: {data['total']:.2f} | Pago: {data['pago']:.2f}"
         embed.add_field(name=nombre, value=valor, inline=False)
 
     await ctx.send(embed=embed)
 
+# ======================
+# PARTIES ABIERTAS
+# ======================
+def guardar_party(msg_id):
+    # Snapshot incremental: solo se marca sucia la party que cambio
+    party_data = wb_parties[msg_id]
+    parties = cargar_parties(party_data["guild_id"])
+    if party_data["cerrada"]:
+        parties.pop(str(msg_id), None)
+    else:
+        parties[str(msg_id)] = datos_party(party_data)
+    almacen_de(party_data["guild_id"]).marcar("parties", msg_id)
+
+def descripcion_party(party_data):
+    if party_data["cerrada"]:
+        estado = "✅ Party finalizada"
+    elif party_data["iniciada"]:
+        estado = "⚔️ Party en curso"
+    else:
+        estado = "⏳ Esperando inicio"
+    return f"Leader: <@{party_data['leader_id']}>\nPuntos a descontar: {party_data['descuento']}\nEstado: {estado}"
+
+def construir_embed_party(guild, party_data, msg_id=None):
+    hora = party_data["hora"]
+    embed = discord.Embed(
+        title=f"Party WB - {hora[:2]}:{hora[2:]} UTC | {party_data['fecha']}",
+        description=descripcion_party(party_data),
+        color=discord.Color.dark_red()
+    )
+
+    for i, rol in enumerate(WB_ROLES):
+        canal_link = enlace_canal_rol(guild, rol) or "[N/A]"
+
+        new_title = f"{REACTIONS[i]} {rol.capitalize()}\n{canal_link}"
+        embed.add_field(name=new_title, value="—", inline=True)
+
+    if len(party_data["_roster"]):
+        renderizar_embed(guild, party_data, embed, msg_id)
+    return embed
+
+def handles_party(msg_id, party_data):
+    # Las parties restauradas despues de un reinicio no tienen mensaje ni
+    # embed en memoria: se rearman desde los datos sin pedir el mensaje.
+    if "_embed" not in party_data:
+        guild = bot.get_guild(party_data["guild_id"])
+        canal = bot.get_partial_messageable(party_data["canal_id"], guild_id=party_data["guild_id"])
+        party_data["_msg"] = canal.get_partial_message(msg_id)
+        party_data["_embed"] = construir_embed_party(guild, party_data, msg_id)
+    return party_data["_msg"], party_data["_embed"]
+
+def restaurar_parties(guild_id):
+    for msg_id, datos in cargar_parties(guild_id).items():
+        party_data = dict(datos)
+        party_data["_roster"] = Roster.desde_dict(
+            WB_ROLES, party_data.pop("roles"), functools.partial(puntos_actuales_de, guild_id)
+        )
+        wb_parties[int(msg_id)] = party_data
+        # La vista se guarda con la party para soltarla al desalojarla
+        party_data["_vista"] = ControlButtons(iniciada=party_data["iniciada"], inscripcion=party_data.get("inscripcion", "reacciones"))
+        bot.add_view(party_data["_vista"], message_id=int(msg_id))
+        programar_party(int(msg_id))
+
+def descontar_puntos(party_data):
+    puntos = cargar_puntos(party_data["guild_id"])
+    descontados = []
+    uids_descontados = []
+    roster = party_data["_roster"]
+    for rol in WB_ROLES:
+        for miembro_id, _ in roster.miembros(rol):
+            uid = str(miembro_id)
+            if uid not in puntos:
+                continue
+            puntos[uid]["puntos_actuales"] -= party_data["descuento"]
+            puntos[uid]["puntos_usados"] += party_data["descuento"]
+            descontados.append(f"<@{uid}>")
+            uids_descontados.append(uid)
+    guardar_puntos(party_data["guild_id"], puntos, uids_descontados, -party_data["descuento"], party_data["leader_id"])
+    # Queda en el historial para saber a quien se le cobro la party
+    party_data["descontados"] = uids_descontados
+    return descontados
+
+# ======================
+# CICLO DE VIDA DE PARTIES
+# ======================
+# Una rueda de timers para todas las parties: aviso, inicio y cierre
+# automaticos, y el desalojo de memoria una vez cerrada
+temporizadores = RuedaTemporizadores()
+TIMERS_PARTY = ("aviso", "inicio", "cierre", "desalojo")
+# Segundos entre reintentos de un timer cuyo guild todavia no esta disponible
+REINTENTO_GUILD = 60
+
+def inicio_party(hora_utc, ahora):
+    # Proxima vez que el reloj UTC marca HHMM; si la hora paso hace menos que
+    # el cierre automatico se toma la de hoy (la party ya esta en curso)
+    if not re.fullmatch(r"\d{4}", hora_utc or ""):
+        return None
+    horas, minutos = int(hora_utc[:2]), int(hora_utc[2:])
+    if horas > 23 or minutos > 59:
+        return None
+    inicio = ahora.replace(hour=horas, minute=minutos, second=0, microsecond=0)
+    if inicio < ahora - timedelta(minutes=CIERRE_AUTOMATICO):
+        inicio += timedelta(days=1)
+    return inicio
+
+def inicio_guardado(party_data):
+    # Las parties guardadas antes de tener "inicio" lo sacan de fecha y hora
+    if "inicio" in party_data:
+        return party_data["inicio"]
+    try:
+        fecha = datetime.strptime(party_data["fecha"] + party_data["hora"], "%d/%m/%Y%H%M")
+    except (KeyError, ValueError):
+        return None
+    return fecha.replace(tzinfo=timezone.utc).timestamp()
+
+def programar_party(msg_id):
+    party_data = wb_parties[msg_id]
+    inicio = inicio_guardado(party_data)
+    if inicio is None or party_data["cerrada"]:
+        return
+    if not party_data["iniciada"]:
+        # Un aviso que ya paso (party creada sobre la hora o bot caido) no se manda tarde
+        if inicio - AVISO_ANTES * 60 > time.time():
+            temporizadores.programar((msg_id, "aviso"), inicio - AVISO_ANTES * 60, functools.partial(avisar_party, msg_id))
+        # Una party armada despues de su hora la inicia el leader: arrancarla
+        # sola no le daria tiempo a nadie de anotarse. Las guardadas antes de
+        # tener "creada" se inician como siempre.
+        if party_data.get("creada", 0) < inicio:
+            temporizadores.programar((msg_id, "inicio"), inicio, functools.partial(iniciar_automatico, msg_id))
+    temporizadores.programar((msg_id, "cierre"), inicio + CIERRE_AUTOMATICO * 60, functools.partial(finalizar_automatico, msg_id))
+
+async def party_vigente(msg_id, tipo, accion):
+    # Los timers vencidos durante un reinicio salen en el primer tick, antes
+    # de que el gateway entregue los guilds: se espera al ready y, si el guild
+    # sigue sin estar (o esta caido un rato), el timer se reprograma en vez de
+    # perderse
+    await bot.wait_until_ready()
+    party_data = wb_parties.get(msg_id)
+    if party_data is None or party_data["cerrada"]:
+        return None
+    guild = bot.get_guild(party_data["guild_id"])
+    if guild is None or guild.unavailable:
+        temporizadores.programar((msg_id, tipo), time.time() + REINTENTO_GUILD, functools.partial(accion, msg_id))
+        return None
+    return party_data
+
+async def avisar_party(msg_id):
+    party_data = await party_vigente(msg_id, "aviso", avisar_party)
+    if party_data is None or party_data["iniciada"] or not len(party_data["_roster"]):
+        return
+    msg, _ = handles_party(msg_id, party_data)
+    roster = party_data["_roster"]
+    menciones = " ".join(f"<@{miembro_id}>" for rol in WB_ROLES for miembro_id, _ in roster.miembros(rol))
+    hora = party_data["hora"]
+    await salida.enviar(("canal", msg.channel.id), PRIORIDAD_ROSTER, msg.reply,
+                        content=f"⏰ La party de las {hora[:2]}:{hora[2:]} UTC arranca en {AVISO_ANTES:g} minutos: {menciones}")
+
+def marcar_iniciada(guild, msg_id, party_data):
+    _, embed = handles_party(msg_id, party_data)
+    party_data["iniciada"] = True
+    guardar_party(msg_id)
+    embed.description = descripcion_party(party_data)
+    renderizar_embed(guild, party_data, embed, msg_id)
+    temporizadores.cancelar((msg_id, "aviso"))
+    temporizadores.cancelar((msg_id, "inicio"))
+    return embed
+
+def quitar_reacciones(msg, party_data):
+    if party_data.get("inscripcion", "reacciones") == "reacciones":
+        salida.programar(("canal", msg.channel.id), PRIORIDAD_DECORATIVA, msg.clear_reactions)
+
+async def iniciar_automatico(msg_id):
+    party_data = await party_vigente(msg_id, "inicio", iniciar_automatico)
+    if party_data is None or party_data["iniciada"]:
+        return
+    embed = marcar_iniciada(bot.get_guild(party_data["guild_id"]), msg_id, party_data)
+    msg, _ = handles_party(msg_id, party_data)
+    vista = ControlButtons(iniciada=True, inscripcion=party_data.get("inscripcion", "reacciones"))
+    # La nueva reemplaza a la anterior en el registro de vistas de discord.py
+    party_data["_vista"] = vista
+    editor_embeds.registrar(msg_id, embed)
+    quitar_reacciones(msg, party_data)
+    await editar_mensaje(msg, PRIORIDAD_ROSTER, embed=embed, view=vista)
+
+def cerrar_party(guild, msg_id, party_data):
+    _, embed = handles_party(msg_id, party_data)
+    party_data["cerrada"] = True
+    guardar_party(msg_id)
+    embed.description = descripcion_party(party_data)
+    renderizar_embed(guild, party_data, embed, msg_id)
+    return embed
+
+async def liquidar_party(msg_id, party_data, canal):
+    editor_embeds.olvidar(msg_id)
+    uids = [str(miembro_id) for rol in WB_ROLES for miembro_id, _ in party_data["_roster"].miembros(rol)]
+    # El descuento tiene que quedar en disco antes de anunciarlo: la
+    # transaccion persiste al salir
+    async with almacen_de(party_data["guild_id"]).transaccion(puntos=uids):
+        descontados = descontar_puntos(party_data)
+        await guardar_historial(party_data)
+        registrar_asistencia(party_data)
+    programar_desalojo(msg_id)
+    await salida.enviar(("canal", canal.id), PRIORIDAD_ROSTER, canal.send,
+                        content=f"✅ Se descontaron {party_data['descuento']} puntos a los miembros: {', '.join(descontados)}")
+
+async def finalizar_automatico(msg_id):
+    party_data = await party_vigente(msg_id, "cierre", finalizar_automatico)
+    if party_data is None:
+        return
+    embed = cerrar_party(bot.get_guild(party_data["guild_id"]), msg_id, party_data)
+    msg, _ = handles_party(msg_id, party_data)
+    await editar_mensaje(msg, PRIORIDAD_ROSTER, embed=embed, view=None)
+    if party_data["iniciada"]:
+        await liquidar_party(msg_id, party_data, msg.channel)
+        return
+    # Una party que nunca arranco no se jugo: se cierra sin descontar
+    # puntos, sin historial y sin contar asistencia
+    editor_embeds.olvidar(msg_id)
+    programar_desalojo(msg_id)
+    await salida.enviar(("canal", msg.channel.id), PRIORIDAD_ROSTER, msg.channel.send,
+                        content="⌛ La party se cerró sin haber iniciado: no se descontaron puntos.")
+
+def programar_desalojo(msg_id):
+    for tipo in TIMERS_PARTY:
+        temporizadores.cancelar((msg_id, tipo))
+    temporizadores.programar((msg_id, "desalojo"), time.time() + DESALOJO * 60, functools.partial(desalojar_party, msg_id))
+
+async def desalojar_party(msg_id):
+    # La party cerrada ya esta en el historial: solo se suelta de memoria,
+    # junto con su vista (sin timeout discord.py la guardaria para siempre)
+    party_data = wb_parties.get(msg_id)
+    if party_data is not None and party_data["cerrada"]:
+        del wb_parties[msg_id]
+        editor_embeds.olvidar(msg_id)
+        vista = party_data.get("_vista")
+        if vista is not None:
+            vista.stop()
+
+async def party_del_leader(interaction, accion):
+    party_data = wb_parties.get(interaction.message.id)
+    if party_data is None or party_data["cerrada"]:
+        await responder(interaction, interaction.response.send_message, content="❌ Esta party ya no está activa.", ephemeral=True)
+        return None
+    if interaction.user.id != party_data["leader_id"]:
+        await responder(interaction, interaction.response.send_message, content=f"⛔ Solo el leader puede {accion}.", ephemeral=True)
+        return None
+    return party_data
+
+async def inscribir(interaction, vista, rol, alternar=False):
+    # Una sola interaccion reemplaza al par remove/add de reacciones y se
+    # contesta editando el mensaje con el roster nuevo.
+    msg_id = interaction.message.id
+    party_data = wb_parties.get(msg_id)
+    if party_data is None or party_data["cerrada"]:
+        await responder(interaction, interaction.response.send_message, content="❌ Esta party ya no está activa.", ephemeral=True)
+        return
+
+    member = interaction.user
+    recordar_nombre(member)
+    roster = party_data["_roster"]
+    if rol is None or (alternar and roster.rol_de(member.id) == rol):
+        roster.quitar(member.id)
+    else:
+        roster.agregar(member.id, member.display_name, rol, puntos_actuales_de(party_data["guild_id"], member.id))
+
+    guardar_party(msg_id)
+    _, embed = handles_party(msg_id, party_data)
+    renderizar_embed(interaction.guild, party_data, embed, msg_id)
+    # Reenviar la vista deja el menu otra vez en el placeholder
+    await responder(interaction, interaction.response.edit_message, embed=embed, view=vista)
+    editor_embeds.registrar(msg_id, embed)
+
+class ControlButtons(View):
+    # Vista persistente: los custom_id fijos permiten volver a engancharla
+    # con bot.add_view despues de un reinicio.
+    def __init__(self, iniciada=False, inscripcion="reacciones"):
+        super().__init__(timeout=None)
+        self.iniciar = self.Iniciar()
+        self.iniciar.disabled = iniciada
+        self.add_item(self.iniciar)
+        self.add_item(self.Sumar())
+        self.add_item(self.Restar())
+        self.add_item(self.Finalizar())
+        if inscripcion == "menu":
+            self.add_item(self.MenuRoles())
+        elif inscripcion == "botones":
+            for i, rol in enumerate(WB_ROLES):
+                self.add_item(self.BotonRol(i, rol))
+            self.add_item(self.BotonSalir())
+
+    class MenuRoles(Select):
+        def __init__(self):
+            opciones = [
+                discord.SelectOption(label=rol.capitalize(), value=rol, emoji=REACTIONS[i])
+                for i, rol in enumerate(WB_ROLES)
+            ]
+            opciones.append(discord.SelectOption(label="Salir de la party", value="_salir", emoji="🚪"))
+            super().__init__(placeholder="Elegí tu rol", options=opciones, custom_id="wb:rol", row=1)
+
+        async def callback(self, interaction):
+            valor = self.values[0]
+            await inscribir(interaction, self.view, None if valor == "_salir" else valor)
+
+    class BotonRol(Button):
+        def __init__(self, i, rol):
+            super().__init__(label=rol.capitalize(), emoji=REACTIONS[i], style=discord.ButtonStyle.primary,
+                             custom_id=f"wb:rol:{rol}", row=1 + i // 5)
+            self.rol = rol
+
+        async def callback(self, interaction):
+            # Tocar el rol en el que ya se esta anotado lo saca de la party
+            await inscribir(interaction, self.view, self.rol, alternar=True)
+
+    class BotonSalir(Button):
+        def __init__(self):
+            super().__init__(label="🚪 Salir", style=discord.ButtonStyle.secondary, custom_id="wb:salir", row=2)
+
+        async def callback(self, interaction):
+            await inscribir(interaction, self.view, None)
+
+    class Iniciar(Button):
+        def __init__(self):
+            super().__init__(label="✅ Iniciar Party", style=discord.ButtonStyle.success, custom_id="wb:iniciar")
+
+        async def callback(self, interaction):
+            party_data = await party_del_leader(interaction, "iniciar la party")
+            if party_data is None:
+                return
+            embed = marcar_iniciada(interaction.guild, interaction.message.id, party_data)
+            self.disabled = True
+            # Responder editando el mensaje es una sola llamada y no hace cola en el canal
+            await responder(interaction, interaction.response.edit_message, embed=embed, view=self.view)
+            editor_embeds.registrar(interaction.message.id, embed)
+            quitar_reacciones(interaction.message, party_data)
+            await responder(interaction, interaction.followup.send, content="⚔️ Party iniciada.", ephemeral=True)
+
+    class Sumar(Button):
+        def __init__(self):
+            super().__init__(label="➕", style=discord.ButtonStyle.secondary, custom_id="wb:sumar")
+
+        async def callback(self, interaction):
+            party_data = await party_del_leader(interaction, "sumar puntos")
+            if party_data is None:
+                return
+            _, embed = handles_party(interaction.message.id, party_data)
+            party_data["descuento"] += 1
+            guardar_party(interaction.message.id)
+            embed.description = descripcion_party(party_data)
+            renderizar_embed(interaction.guild, party_data, embed, interaction.message.id)
+            await responder(interaction, interaction.response.edit_message, embed=embed, view=self.view)
+            editor_embeds.registrar(interaction.message.id, embed)
+            #await interaction.response.send_message("➕ Descuento actualizado.", ephemeral=True)
+
+    class Restar(Button):
+        def __init__(self):
+            super().__init__(label="➖", style=discord.ButtonStyle.secondary, custom_id="wb:restar")
+
+        async def callback(self, interaction):
+            party_data = await party_del_leader(interaction, "restar puntos")
+            if party_data is None:
+                return
+            _, embed = handles_party(interaction.message.id, party_data)
+            if party_data["descuento"] > 0:
+                party_data["descuento"] -= 1
+                guardar_party(interaction.message.id)
+                embed.description = descripcion_party(party_data)
+                renderizar_embed(interaction.guild, party_data, embed, interaction.message.id)
+                await responder(interaction, interaction.response.edit_message, embed=embed, view=self.view)
+                editor_embeds.registrar(interaction.message.id, embed)
+                #await interaction.response.send_message("➖ Descuento actualizado.", ephemeral=True)
+            else:
+                await responder(interaction, interaction.response.send_message, content="⚠️ No puede ser menor a 0.", ephemeral=True)
+
+    class Finalizar(Button):
+        def __init__(self):
+            super().__init__(label="❌ Finalizar Party", style=discord.ButtonStyle.danger, custom_id="wb:finalizar")
+
+        async def callback(self, interaction):
+            party_data = await party_del_leader(interaction, "finalizar la party")
+            if party_data is None:
+                return
+            embed = cerrar_party(interaction.guild, interaction.message.id, party_data)
+            await responder(interaction, interaction.response.edit_message, embed=embed, view=None)
+            await liquidar_party(interaction.message.id, party_data, interaction.channel)
+            await responder(interaction, interaction.followup.send, content="✅ Party finalizada.", ephemeral=True)
+
 @bot.command()
 @es_party_leader()
 async def wb(ctx, hora_utc: str):
-    from datetime import datetime
-    fecha_actual = datetime.utcnow().strftime("%d/%m/%Y")
+    inicio = inicio_party(hora_utc, datetime.now(timezone.utc))
+    if inicio is None:
+        return await ctx.send("❌ La hora tiene que ser HHMM en UTC. Ejemplo: !wb 1800.")
 
     hora_formateada = f"{hora_utc[:2]}:{hora_utc[2:]}"
     party_data = {
         "leader_id": ctx.author.id,
         "hora": hora_utc,
-        "fecha": fecha_actual,
-        "roles": {rol: [] for rol in WB_ROLES},
+        # La fecha es la del dia en que se juega, que puede ser mañana
+        "fecha": inicio.strftime("%d/%m/%Y"),
+        "inicio": inicio.timestamp(),
+        "creada": time.time(),
+        "_roster": Roster(WB_ROLES),
         "cerrada": False,
         "iniciada": False,
-        "descuento": 0
+        "descuento": 0,
+        "guild_id": ctx.guild.id,
+        "canal_id": ctx.channel.id,
+        "inscripcion": MODO_INSCRIPCION
     }
 
-    embed = discord.Embed(
-        title=f"Party WB - {hora_formateada} UTC | {fecha_actual}",
-        description=f"Leader: {ctx.author.mention}\nPuntos a descontar: 0\nEstado: ⏳ Esperando inicio",
-        color=discord.Color.dark_red()
-    )
+    embed = construir_embed_party(ctx.guild, party_data)
 
-    for i, rol in enumerate(WB_ROLES):
-        canal_name = f"b-{rol}"
-        canal = discord.utils.get(ctx.guild.text_channels, name=canal_name)
-        canal_link = f"https://discord.com/channels/{ctx.guild.id}/{canal.id}" if canal else "[N/A]"
-
-        new_title = f"{REACTIONS[i]} {rol.capitalize()}\n{canal_link}"
-        embed.add_field(name=new_title, value="—", inline=True)
-
-    class ControlButtons(View):
-        def __init__(self):
-            super().__init__(timeout=None)
-            self.iniciar = self.Iniciar()
-            self.add_item(self.iniciar)
-            self.add_item(self.Sumar())
-            self.add_item(self.Restar())
-            self.add_item(self.Finalizar())
-
-        class Iniciar(Button):
-            def __init__(self):
-                super().__init__(label="✅ Iniciar Party", style=discord.ButtonStyle.success)
-
-            async def callback(self, interaction):
-                if interaction.user.id != ctx.author.id:
-                    return await interaction.response.send_message("⛔ Solo el leader puede iniciar la party.", ephemeral=True)
-                party_data["iniciada"] = True
-                embed.description = f"Leader: {ctx.author.mention}\nPuntos a descontar: {party_data['descuento']}\nEstado: ⚔️ Party en curso"
-                self.disabled = True
-                await actualizar_embed(interaction.message, party_data, embed)
-                await interaction.message.edit(embed=embed, view=self.view)
-                await interaction.message.clear_reactions()
-                await interaction.response.send_message("⚔️ Party iniciada.", ephemeral=True)
-
-        class Sumar(Button):
-            def __init__(self):
-                super().__init__(label="➕", style=discord.ButtonStyle.secondary)
-
-            async def callback(self, interaction):
-                if interaction.user.id != ctx.author.id:
-                    return await interaction.response.send_message("⛔ Solo el leader puede sumar puntos.", ephemeral=True)
-                party_data["descuento"] += 1
-                embed.description = f"Leader: {ctx.author.mention}\nPuntos a descontar: {party_data['descuento']}\nEstado: ⚔️ Party en curso" if party_data["iniciada"] else f"Leader: {ctx.author.mention}\nPuntos a descontar: {party_data['descuento']}\nEstado: ⏳ Esperando inicio"
-                await actualizar_embed(interaction.message, party_data, embed)
-                await interaction.message.edit(embed=embed, view=self.view)
-                #await interaction.response.send_message("➕ Descuento actualizado.", ephemeral=True)
-
-        class Restar(Button):
-            def __init__(self):
-                super().__init__(label="➖", style=discord.ButtonStyle.secondary)
-
-            async def callback(self, interaction):
-                if interaction.user.id != ctx.author.id:
-                    return await interaction.response.send_message("⛔ Solo el leader puede restar puntos.", ephemeral=True)
-                if party_data["descuento"] > 0:
-                    party_data["descuento"] -= 1
-                    embed.description = f"Leader: {ctx.author.mention}\nPuntos a descontar: {party_data['descuento']}\nEstado: ⚔️ Party en curso" if party_data["iniciada"] else f"Leader: {ctx.author.mention}\nPuntos a descontar: {party_data['descuento']}\nEstado: ⏳ Esperando inicio"
-                    await actualizar_embed(interaction.message, party_data, embed)
-                    await interaction.message.edit(embed=embed, view=self.view)
-                    #await interaction.response.send_message("➖ Descuento actualizado.", ephemeral=True)
-                else:
-                    await interaction.response.send_message("⚠️ No puede ser menor a 0.", ephemeral=True)
-
-        class Finalizar(Button):
-            def __init__(self):
-                super().__init__(label="❌ Finalizar Party", style=discord.ButtonStyle.danger)
-
-            async def callback(self, interaction):
-                if interaction.user.id != ctx.author.id:
-                    return await interaction.response.send_message("⛔ Solo el leader puede finalizar la party.", ephemeral=True)
-                party_data["cerrada"] = True
-                embed.description = f"Leader: {ctx.author.mention}\nPuntos a descontar: {party_data['descuento']}\nEstado: ✅ Party finalizada"
-                await actualizar_embed(interaction.message, party_data, embed)
-                await interaction.message.edit(embed=embed, view=None)
-                puntos = cargar_puntos()
-                descontados = []
-                for lista in party_data["roles"].values():
-                    for miembro in lista:
-                        uid = str(miembro["id"])
-                        if uid not in puntos:
-                            continue
-                        puntos[uid]["puntos_actuales"] -= party_data["descuento"]
-                        puntos[uid]["puntos_usados"] += party_data["descuento"]
-                        descontados.append(f"<@{uid}>")
-                guardar_puntos(puntos)
-                guardar_historial(party_data)
-                await interaction.channel.send(f"✅ Se descontaron {party_data['descuento']} puntos a los miembros: {', '.join(descontados)}")
-                await interaction.response.send_message("✅ Party finalizada.", ephemeral=True)
-
-    msg = await ctx.send(embed=embed, view=ControlButtons())
+    vista = ControlButtons(inscripcion=MODO_INSCRIPCION)
+    msg = await ctx.send(embed=embed, view=vista)
+    party_data["_msg"] = msg
+    party_data["_vista"] = vista
+    party_data["_embed"] = embed
     wb_parties[msg.id] = party_data
+    guardar_party(msg.id)
+    programar_party(msg.id)
 
-    for emoji in REACTIONS:
-        await msg.add_reaction(emoji)
-
-    await msg.create_thread(name=f"WB {hora_formateada} - Discusión")
+    # Reacciones e hilo no se esperan: van al final de la cola del canal y
+    # cualquier boton o edicion de roster que llegue mientras tanto pasa antes.
+    if MODO_INSCRIPCION == "reacciones":
+        for emoji in REACTIONS:
+            salida.programar(("canal", msg.channel.id), PRIORIDAD_DECORATIVA, functools.partial(msg.add_reaction, emoji))
+    salida.programar(("canal", msg.channel.id), PRIORIDAD_DECORATIVA, msg.create_thread, name=f"WB {hora_formateada} - Discusión")
 
 @bot.command()
 async def score(ctx, *args):
-    puntos = cargar_puntos()
-    es_lider = any(role.name == ROLE_PARTY_LEADER for role in ctx.author.roles)
-    es_miembro = any(role.name == ROLE_MEMBER for role in ctx.author.roles)
+    puntos = cargar_puntos(ctx.guild.id)
+    lider = es_lider(ctx.author)
 
-    if not (es_lider or es_miembro):
+    if not (lider or es_miembro(ctx.author)):
         return await ctx.send("⛔ No tenés permiso para usar este comando.")
 
     if len(args) == 0:
@@ -530,41 +1366,67 @@ async def score(ctx, *args):
         embed.add_field(name="Obtenidos", value=str(data['puntos_obtenidos']), inline=True)
         embed.add_field(name="Usados", value=str(data['puntos_usados']), inline=True)
         return await ctx.send(embed=embed)
-    elif es_lider:
+    elif lider:
         try:
             valor = int(args[-1])
             menciones = ctx.message.mentions
             if not menciones:
                 return await ctx.send("❌ Tenés que mencionar al menos un usuario.")
-            for user in menciones:
-                uid = str(user.id)
-                data = puntos.get(uid, {"puntos_actuales": 0, "puntos_obtenidos": 0, "puntos_usados": 0})
-                data["puntos_actuales"] += valor
-                if valor >= 0:
-                    data["puntos_obtenidos"] += valor
-                else:
-                    data["puntos_usados"] += abs(valor)
-                puntos[uid] = data
-            guardar_puntos(puntos)
+            uids = [str(u.id) for u in menciones]
+            async with almacen_de(ctx.guild.id).transaccion(puntos=uids):
+                # Se relee adentro: un scorereset pudo reemplazar la coleccion mientras se esperaba
+                puntos = cargar_puntos(ctx.guild.id)
+                for uid in uids:
+                    data = puntos.get(uid, {"puntos_actuales": 0, "puntos_obtenidos": 0, "puntos_usados": 0})
+                    ajustar_puntos(data, valor)
+                    puntos[uid] = data
+                guardar_puntos(ctx.guild.id, puntos, uids, valor, ctx.author.id)
             return await ctx.send(f"✅ Se actualizaron los puntos en {len(menciones)} usuarios.")
         except ValueError:
             return await ctx.send("❌ El último argumento debe ser un número para sumar o restar puntos.")
 
+def linea_movimiento(registro):
+    valor = registro["v"]
+    if registro["u"] is None:
+        resultado = "colección reemplazada"
+    elif valor is None:
+        resultado = "borrado"
+    elif registro["c"] == "puntos":
+        resultado = f"actuales {valor.get('puntos_actuales', 0)}"
+    else:
+        resultado = f"deuda {valor.get('deuda', 0):.2f}"
+    quien = f"<@{registro['u']}>" if registro["u"] is not None else "todos"
+    delta = f" ({registro['d']:+g})" if "d" in registro else ""
+    actor = f" por <@{registro['a']}>" if "a" in registro else ""
+    return f"`#{registro['s']}` <t:{registro['t']}:f> {registro['c']} {quien}{delta} → {resultado}{actor}"
+
+@bot.command()
+@es_party_leader()
+async def movimientos(ctx, member: discord.Member = None):
+    libro = almacen_de(ctx.guild.id).libro
+    registros = await asyncio.to_thread(
+        libro.recientes, MOVIMIENTOS_POR_CONSULTA, str(member.id) if member else None
+    )
+    if not registros:
+        return await ctx.send("❌ No hay movimientos registrados.")
+    titulo = f"🧾 Movimientos de {member.display_name}" if member else "🧾 Últimos movimientos"
+    embed = discord.Embed(title=titulo, description="\n".join(linea_movimiento(r) for r in registros), color=discord.Color.dark_gold())
+    await ctx.send(embed=embed)
+
 @bot.command()
 async def ranking(ctx):
-    puntos = cargar_puntos()
-    if not puntos:
+    ranking = ranking_de(ctx.guild.id, "puntos_obtenidos").top(10)
+    if not ranking:
         return await ctx.send("❌ No hay datos de puntos todavía.")
 
-    ranking = sorted(puntos.items(), key=lambda item: item[1].get("puntos_obtenidos", 0), reverse=True)
+    directorio = await nombres_de(ctx.guild, [uid for uid, _ in ranking])
+    nombres = [directorio.get(uid, "-") for uid, _ in ranking]
+
     embed = discord.Embed(title="🏆 Ranking de puntos obtenidos (Top 10)", color=discord.Color.gold())
-    embed.add_field(name="POS", value="\n".join([str(i+1) for i in range(min(10, len(ranking)))]), inline=True)
-    embed.add_field(name="Miembro", value="\n".join([
-        ctx.guild.get_member(int(uid)).display_name if ctx.guild.get_member(int(uid)) else "-"
-        for uid, _ in ranking[:10]
-    ]), inline=True)
+    embed.add_field(name="POS", value="\n".join([str(i+1) for i in range(len(ranking))]), inline=True)
+    embed.add_field(name="Miembro", value="\n".join(nombres), inline=True)
     embed.add_field(name="Obtenidos", value="\n".join([
-        str(data["puntos_obtenidos"]) for _, data in ranking[:10]
+        str(obtenidos) for _, obtenidos in ranking
     ]), inline=True)
     await ctx.send(embed=embed)
 
@@ -572,89 +1434,183 @@ async def ranking(ctx):
 @es_party_leader()
 async def scorereset(ctx):
     puntos = {}
-    for member in ctx.guild.members:
-        if member.bot:
-            continue
-        uid = str(member.id)
-        puntos[uid] = {
-            "puntos_actuales": 0,
-            "puntos_obtenidos": 0,
-            "puntos_usados": 0
-        }
-
-    guardar_puntos(puntos)
+    # Toma la coleccion entera: ningun score o descuento se cuela durante el chunk
+    async with almacen_de(ctx.guild.id).transaccion(puntos=None):
+        # Sin chunking la cache no tiene a todos: se piden una vez sin guardarlos
+        miembros = ctx.guild.members if ctx.guild.chunked else await ctx.guild.chunk(cache=False)
+        for member in miembros:
+            if member.bot:
+                continue
+            uid = str(member.id)
+            puntos[uid] = {
+                "puntos_actuales": 0,
+                "puntos_obtenidos": 0,
+                "puntos_usados": 0
+            }
+
+        guardar_puntos(ctx.guild.id, puntos, actor=ctx.author.id)
     await ctx.send("✅ ¡Todos los puntos han sido reseteados y todos los miembros inicializados en 0!")
 
 @bot.command()
 async def scores(ctx):
-    puntos = cargar_puntos()
-    if not puntos:
+    ranking_actuales = ranking_de(ctx.guild.id, "puntos_actuales")
+    if not len(ranking_actuales):
         return await ctx.send("❌ No hay puntos registrados todavía.")
 
-    # Ordenar por puntos actuales, de mayor a menor
-    ranking = sorted(puntos.items(), key=lambda item: item[1].get("puntos_actuales", 0), reverse=True)
-    paginas = [ranking[i:i + 10] for i in range(0, len(ranking), 10)]
-    total_paginas = len(paginas)
-    index = 0
+    # El indice ya esta ordenado por puntos actuales: cada pagina es un slice
+    def total_paginas():
+        return max(1, (len(ranking_actuales) + 9) // 10)
 
-    def crear_embed(pagina, num_pagina):
+    async def crear_embed(index):
+        pagina = ranking_actuales.rango(index * 10, 10)
+        nombres = await nombres_de(ctx.guild, [uid for uid, _ in pagina])
         embed = discord.Embed(title="Score de Gremio", color=discord.Color.purple())
         descripcion = ""
-        for idx, (uid, data) in enumerate(pagina, start=1 + num_pagina * 10 - 10):
-            member = ctx.guild.get_member(int(uid))
-            nombre = member.display_name if member else "Usuario desconocido"
-            puntos_actuales = data.get("puntos_actuales", 0)
+        for idx, (uid, puntos_actuales) in enumerate(pagina, start=1 + index * 10):
+            nombre = nombres.get(uid, "Usuario desconocido")
             descripcion += f"**{idx}. {nombre}** — {puntos_actuales} puntos\n"
 
         embed.description = descripcion
-        embed.set_footer(text=f"Página {num_pagina}/{total_paginas}")
+        embed.set_footer(text=f"Página {index + 1}/{total_paginas()}")
         return embed
 
-    view = View()
-
-    async def actualizar(mensaje):
-        embed = crear_embed(paginas[index], index + 1)
-        await mensaje.edit(embed=embed, view=view)
-
-    class Anterior(Button):
-        def __init__(self):
-            super().__init__(label="⬅️ Anterior", style=discord.ButtonStyle.primary)
-        async def callback(self, interaction):
-            nonlocal index
-            if index > 0:
-                index -= 1
-                await actualizar(interaction.message)
-                await interaction.response.defer()
-
-    class Siguiente(Button):
-        def __init__(self):
-            super().__init__(label="➡️ Siguiente", style=discord.ButtonStyle.primary)
-        async def callback(self, interaction):
-            nonlocal index
-            if index < len(paginas) - 1:
-                index += 1
-                await actualizar(interaction.message)
-                await interaction.response.defer()
+    almacen = almacen_de(ctx.guild.id)
+    fuente = FuentePaginas(
+        ("scores", ctx.guild.id), total_paginas,
+        lambda: (almacen.version("puntos"), almacen.version("nombres")), crear_embed
+    )
+    await Paginador(fuente, paginas_renderizadas, responder, editar_mensaje, TIMEOUT_PAGINADOR).enviar(ctx)
+
+def metricas_extra():
+    extra = {
+        "parties_abiertas": sum(1 for p in wb_parties.values() if not p["cerrada"]),
+        "particiones_cargadas": len(almacenes),
+        "parties_en_memoria": len(wb_parties),
+        "timers_pendientes": len(temporizadores),
+    }
+    for nombre, valor in editor_embeds.stats.items():
+        extra[f"ediciones_embed_{nombre}"] = valor
+    for nombre, valor in salida.stats.items():
+        extra[f"salida_{nombre}"] = valor
+    extra["salida_en_cola"] = sum(len(cola) for cola in salida.colas.values())
+    for nombre, valor in paginas_renderizadas.stats.items():
+        extra[f"cache_paginas_{nombre}"] = valor
+    return extra
+
+def resumen_histogramas(nombre, limite=8):
+    histogramas = sorted(metricas.por_nombre(nombre).items(), key=lambda item: item[1].total, reverse=True)
+    lineas = [
+        f"`{etiqueta}` n={h.total} p50≤{h.cuantil(0.5):g} p99≤{h.cuantil(0.99):g} max={h.maximo:.1f}"
+        for etiqueta, h in histogramas[:limite]
+    ]
+    return "\n".join(lineas) if lineas else "Sin datos."
 
-    view.add_item(Anterior())
-    view.add_item(Siguiente())
+@bot.command()
+@es_party_leader()
+async def stats(ctx, member: discord.Member = None):
+    if member is not None:
+        return await ctx.send(embed=embed_asistencia(ctx.guild, member))
+
+    embed = discord.Embed(title="📈 Métricas del bot (ms)", color=discord.Color.teal())
+    embed.add_field(name="Comandos", value=resumen_histogramas("comando"), inline=False)
+    embed.add_field(name="Eventos", value=resumen_histogramas("evento"), inline=False)
+    embed.add_field(name="Almacenamiento", value=resumen_histogramas("almacen"), inline=False)
+
+    llamadas = sum(v for (n, _), v in metricas.contadores.items() if n == "rest_llamadas")
+    limitadas = metricas.contadores.get(("rest_429", ""), 0)
+    embed.add_field(name="API REST", value=f"Llamadas: {llamadas}\n429: {limitadas}\n{resumen_histogramas('rest', 3)}", inline=False)
+
+    lag = metricas.histogramas.get(("lag_loop", "loop"))
+    valor_lag = f"p50≤{lag.cuantil(0.5):g} p99≤{lag.cuantil(0.99):g} max={lag.maximo:.1f}" if lag else "Sin datos."
+    embed.add_field(name="Lag del event loop", value=valor_lag, inline=False)
+
+    ediciones = editor_embeds.stats
+    embed.add_field(
+        name="Ediciones de roster",
+        value=f"Encoladas: {ediciones['encoladas']} | Fusionadas: {ediciones['fusionadas']} | Omitidas: {ediciones['omitidas']} | Enviadas: {ediciones['enviadas']}",
+        inline=False
+    )
+    cola = salida.stats
+    embed.add_field(
+        name="Cola de salida",
+        value=f"Encolados: {cola['encolados']} | Reemplazados: {cola['reemplazados']} | Ejecutados: {cola['ejecutados']} | Fallidos: {cola['fallidos']}",
+        inline=False
+    )
+    await ctx.send(embed=embed)
 
-    mensaje = await ctx.send(embed=crear_embed(paginas[index], index + 1), view=view)
+def distribucion_roles(roles, total):
+    orden = WB_ROLES + sorted(rol for rol in roles if rol not in WB_ROLES)
+    lineas = [f"{rol}: {roles[rol]} ({roles[rol] * 100 / total:.0f}%)" for rol in orden if roles.get(rol)]
+    return "\n".join(lineas) or "Sin datos."
+
+def embed_asistencia(guild, member):
+    almacen = almacen_de(guild.id)
+    datos = almacen.obtener("asistencia").get(str(member.id), asistencia_vacia())
+    gremio = almacen.obtener("resumen").get("gremio", resumen_vacio())
+    parties = datos["parties"]
+
+    embed = discord.Embed(title=f"📊 Asistencia de {member.display_name}", color=discord.Color.teal())
+    porcentaje = parties * 100 / gremio["parties"] if gremio["parties"] else 0
+    embed.add_field(name="Parties", value=f"{parties} ({porcentaje:.0f}% del gremio)", inline=True)
+    embed.add_field(name="Lideradas", value=str(datos["lideradas"]), inline=True)
+    embed.add_field(name="Última", value=datos["ultima"] or "-", inline=True)
+    promedio = datos["puntos_gastados"] / parties if parties else 0
+    embed.add_field(name="Puntos gastados", value=f"{datos['puntos_gastados']} ({promedio:.1f} por party)", inline=False)
+    embed.add_field(name="Roles", value=distribucion_roles(datos["roles"], parties), inline=False)
+    return embed
+
+@bot.command(name="resumen")
+@es_party_leader()
+async def resumen_gremio(ctx):
+    gremio = almacen_de(ctx.guild.id).obtener("resumen").get("gremio", resumen_vacio())
+    if not gremio["parties"]:
+        return await ctx.send("❌ Todavía no hay parties finalizadas.")
+
+    embed = discord.Embed(title="📊 Resumen de asistencia del gremio", color=discord.Color.teal())
+    embed.add_field(name="Parties", value=str(gremio["parties"]), inline=True)
+    embed.add_field(name="Asistencias", value=f"{gremio['asistencias']} ({gremio['asistencias'] / gremio['parties']:.1f} por party)", inline=True)
+    embed.add_field(name="Puntos gastados", value=str(gremio["puntos_gastados"]), inline=True)
+    embed.add_field(name="Roles", value=distribucion_roles(gremio["roles"], gremio["asistencias"]), inline=False)
+
+    presentes = [(uid, n) for uid, n in ranking_de(ctx.guild.id, "parties").top(10) if n]
+    directorio = await nombres_de(ctx.guild, [uid for uid, _ in presentes])
+    embed.add_field(name="Más presentes", value="\n".join(
+        f"{i+1}. {directorio.get(uid, '-')} — {n}" for i, (uid, n) in enumerate(presentes)
+    ) or "-", inline=False)
+    await ctx.send(embed=embed)
 
 @bot.command()
 @es_party_leader()
 async def prefix(ctx, nuevo_prefijo: str = None):
-    global PREFIJO
-
     if not nuevo_prefijo:
         return await ctx.send("❌ Tenés que especificar un nuevo prefijo. Ejemplo: `!prefix ?`")
 
-    bot.command_prefix = nuevo_prefijo
-    PREFIJO = nuevo_prefijo
+    await guardar_config(ctx.guild.id, prefijo=nuevo_prefijo)
 
     await ctx.send(f"✅ Prefijo actualizado correctamente a `{nuevo_prefijo}`")
 
+@bot.command(name="config")
+@es_party_leader()
+async def config_guild(ctx, clave: str = None, *, valor: str = None):
+    config = config_de(ctx.guild.id)
+    if clave is None:
+        embed = discord.Embed(title="⚙️ Configuración del servidor", color=discord.Color.dark_grey())
+        for nombre in CLAVES_CONFIG:
+            embed.add_field(name=nombre, value=f"`{config[nombre]}`", inline=True)
+        return await ctx.send(embed=embed)
+
+    if clave not in CLAVES_CONFIG:
+        return await ctx.send(f"❌ Clave inválida. Opciones: {', '.join(CLAVES_CONFIG)}.")
+    if not valor:
+        return await ctx.send(f"❌ Tenés que especificar un valor. Ejemplo: `{config['prefijo']}config {clave} <valor>`")
+
+    await guardar_config(ctx.guild.id, **{clave: valor})
+    await ctx.send(f"✅ `{clave}` actualizado a `{valor}`.")
+
 # ======================
 # EJECUTAR BOT
 # ======================
-bot.run(TOKEN)
+if __name__ == "__main__":
+    bot.run(TOKEN)
+    for almacen in almacenes.values():
+        almacen.cerrar()
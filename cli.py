@@ -0,0 +1,329 @@
+import argparse
+import asyncio
+import csv
+import json
+import math
+import os
+import re
+import shutil
+import sys
+import tempfile
+from collections import Counter
+
+# ======================
+# IMPORTAR Y EXPORTAR
+# ======================
+# Uso: python cli.py exportar puntos --guild 123 [--archivo puntos.csv]
+#      python cli.py importar puntos --guild 123 --modo ajustar --archivo ajustes.csv [--simular]
+#      python cli.py importar historial --guild 123 --archivo temporada.jsonl
+# Trabaja sobre la particion del guild con el bot apagado (comparten archivos
+# y libro de movimientos), desde el mismo directorio y entorno que bot.py.
+# Los registros se leen de a uno; una importacion se valida entera y se
+# aplica en una sola escritura, o no se aplica.
+
+COLUMNAS = {
+    "puntos": ("uid", "nombre", "puntos_actuales", "puntos_obtenidos", "puntos_usados"),
+    "multas": ("uid", "nombre", "deuda", "total", "pago"),
+    "bans": ("uid", "nombre"),
+    # En csv va una fila por miembro de cada party; en jsonl, la party entera
+    "historial": ("fecha", "hora", "leader_id", "descuento", "rol", "uid", "nombre"),
+}
+CAMPOS = {
+    "puntos": {"puntos_actuales": int, "puntos_obtenidos": int, "puntos_usados": int},
+    "multas": {"deuda": float, "total": float, "pago": float},
+}
+ERRORES_MOSTRADOS = 20
+LOTE_HISTORIAL = 1000
+
+class RegistroInvalido(ValueError):
+    pass
+
+# ======================
+# LECTURA Y VALIDACION
+# ======================
+def formato_de(args):
+    if args.formato:
+        return args.formato
+    return "jsonl" if args.archivo.endswith(".jsonl") else "csv"
+
+def leer_registros(archivo, formato):
+    # (numero de linea, registro); una linea que no es JSON llega como None
+    if formato == "csv":
+        lector = csv.DictReader(archivo)
+        for registro in lector:
+            yield lector.line_num, registro
+        return
+    for numero, linea in enumerate(archivo, 1):
+        if not linea.strip():
+            continue
+        try:
+            registro = json.loads(linea)
+        except json.JSONDecodeError:
+            registro = None
+        yield numero, registro if isinstance(registro, dict) else None
+
+def validar_uid(valor, campo="uid"):
+    uid = str(valor if valor is not None else "").strip()
+    if not uid.isdigit():
+        raise RegistroInvalido(f"{campo} inválido: {valor!r}")
+    return uid
+
+def validar_numero(registro, campo, tipo):
+    valor = registro.get(campo)
+    if valor is None or valor == "":
+        raise RegistroInvalido(f"falta {campo}")
+    try:
+        numero = tipo(valor)
+    except (TypeError, ValueError):
+        raise RegistroInvalido(f"{campo} no es {'un entero' if tipo is int else 'un número'}: {valor!r}")
+    if isinstance(numero, float) and not math.isfinite(numero):
+        raise RegistroInvalido(f"{campo} no es finito: {valor!r}")
+    return numero
+
+def validar_party(bot, registro, guild_id):
+    leader_id = validar_uid(registro.get("leader_id"), "leader_id")
+    if not re.fullmatch(r"\d{2}/\d{2}/\d{4}", str(registro.get("fecha", ""))):
+        raise RegistroInvalido(f"fecha inválida (dd/mm/aaaa): {registro.get('fecha')!r}")
+    if not re.fullmatch(r"\d{4}", str(registro.get("hora", ""))):
+        raise RegistroInvalido(f"hora inválida (HHMM): {registro.get('hora')!r}")
+    descuento = validar_numero({"descuento": registro.get("descuento", 0)}, "descuento", int)
+    roles = registro.get("roles")
+    if not isinstance(roles, dict):
+        raise RegistroInvalido("falta roles")
+    limpios = {}
+    for rol, miembros in roles.items():
+        if rol not in bot.WB_ROLES:
+            raise RegistroInvalido(f"rol desconocido: {rol!r}")
+        if not isinstance(miembros, list) or not all(isinstance(m, dict) for m in miembros):
+            raise RegistroInvalido(f"los miembros de {rol} no son una lista")
+        limpios[rol] = [{"id": int(validar_uid(m.get("id"), "id")), "nombre": str(m.get("nombre", ""))} for m in miembros]
+
+    entry = dict(registro)
+    entry.update(leader_id=int(leader_id), descuento=descuento, roles=limpios, guild_id=guild_id, cerrada=True)
+    return entry
+
+class Importacion:
+    def __init__(self, saltar_invalidas):
+        self.saltar_invalidas = saltar_invalidas
+        self.errores = []
+        self.leidos = 0
+
+    def registros(self, fuente, validar):
+        # Valida de a uno y junta los errores sin cortar la lectura
+        for numero, registro in fuente:
+            self.leidos += 1
+            try:
+                if registro is None:
+                    raise RegistroInvalido("no es un objeto JSON")
+                yield validar(registro)
+            except RegistroInvalido as e:
+                self.errores.append((numero, str(e)))
+
+    def aplicable(self):
+        return not self.errores or self.saltar_invalidas
+
+    def informar(self):
+        for numero, mensaje in self.errores[:ERRORES_MOSTRADOS]:
+            print(f"línea {numero}: {mensaje}", file=sys.stderr)
+        if len(self.errores) > ERRORES_MOSTRADOS:
+            print(f"... y {len(self.errores) - ERRORES_MOSTRADOS} errores más", file=sys.stderr)
+
+# ======================
+# IMPORTAR
+# ======================
+async def importar_valores(bot, almacen, nombre, fuente, args, importacion):
+    # Los cambios se arman aparte (uno por miembro, no por fila) y recien al
+    # final se aplican todos juntos dentro de una transaccion
+    data = almacen.obtener(nombre)
+    cambios = {}
+    deltas = Counter()
+    ajustar = bot.ajustar_puntos if nombre == "puntos" else bot.ajustar_multa
+    tipo = int if nombre == "puntos" else float
+
+    def validar(registro):
+        uid = validar_uid(registro.get("uid"))
+        if nombre == "bans":
+            return uid, True, None
+        if args.modo == "ajustar":
+            return uid, None, validar_numero(registro, "valor", tipo)
+        return uid, {campo: validar_numero(registro, campo, t) for campo, t in CAMPOS[nombre].items()}, None
+
+    for uid, valor, delta in importacion.registros(fuente, validar):
+        if delta is not None:
+            valor = cambios.get(uid) or dict(data.get(uid) or {campo: t() for campo, t in CAMPOS[nombre].items()})
+            ajustar(valor, delta)
+            deltas[uid] += delta
+        cambios[uid] = valor
+
+    if not importacion.aplicable() or args.simular:
+        return len(cambios)
+
+    async with almacen.transaccion(**{nombre: None}):
+        if nombre == "bans":
+            if args.modo == "reemplazar":
+                almacen.guardar("bans", list(cambios), actor=args.actor)
+            else:
+                presentes = set(data)
+                nuevos = [uid for uid in cambios if uid not in presentes]
+                data.extend(nuevos)
+                almacen.guardar("bans", data, nuevos, actor=args.actor)
+        elif args.modo == "reemplazar":
+            almacen.guardar(nombre, cambios, actor=args.actor)
+        elif args.modo == "ajustar":
+            data.update(cambios)
+            for uid in cambios:
+                almacen.guardar(nombre, data, [uid], deltas[uid], args.actor)
+        else:
+            data.update(cambios)
+            almacen.guardar(nombre, data, list(cambios), actor=args.actor)
+    return len(cambios)
+
+async def importar_historial(bot, almacen, ruta, args, importacion):
+    # Dos pasadas sobre el archivo: la primera solo valida, la segunda agrega
+    # por lotes, asi un archivo con errores no deja el historial a medias
+    def validar(registro):
+        return validar_party(bot, registro, args.guild)
+
+    with open(ruta, "r", encoding="utf-8") as f:
+        validas = sum(1 for _ in importacion.registros(leer_registros(f, "jsonl"), validar))
+    if not importacion.aplicable() or args.simular:
+        return validas
+
+    with open(ruta, "r", encoding="utf-8") as f:
+        lote = []
+        for entry in Importacion(True).registros(leer_registros(f, "jsonl"), validar):
+            lote.append(entry)
+            if len(lote) == LOTE_HISTORIAL:
+                await asyncio.to_thread(almacen.agregar_historial_lote, lote)
+                lote = []
+        if lote:
+            await asyncio.to_thread(almacen.agregar_historial_lote, lote)
+    bot.reconstruir_asistencia(almacen)
+    await almacen.persistir()
+    return validas
+
+async def importar(bot, almacen, args):
+    formato = formato_de(args)
+    importacion = Importacion(args.saltar_invalidas)
+    if args.coleccion == "historial":
+        if args.archivo != "-":
+            aplicados = await importar_historial(bot, almacen, args.archivo, args, importacion)
+        else:
+            # stdin no se puede leer dos veces: se copia a un temporal
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".jsonl", delete=False) as tmp:
+                shutil.copyfileobj(sys.stdin, tmp)
+            try:
+                aplicados = await importar_historial(bot, almacen, tmp.name, args, importacion)
+            finally:
+                os.remove(tmp.name)
+    elif args.archivo == "-":
+        aplicados = await importar_valores(bot, almacen, args.coleccion, leer_registros(sys.stdin, formato), args, importacion)
+    else:
+        with open(args.archivo, "r", encoding="utf-8", newline="") as f:
+            aplicados = await importar_valores(bot, almacen, args.coleccion, leer_registros(f, formato), args, importacion)
+
+    importacion.informar()
+    if not importacion.aplicable():
+        print(f"❌ {len(importacion.errores)} registros inválidos de {importacion.leidos}: no se aplicó nada.", file=sys.stderr)
+        return 1
+    accion = "se aplicarían" if args.simular else "aplicados"
+    print(f"✅ {importacion.leidos} registros leídos, {aplicados} {accion}, {len(importacion.errores)} omitidos.", file=sys.stderr)
+    return 0
+
+# ======================
+# EXPORTAR
+# ======================
+def filas_exportacion(almacen, nombre, formato):
+    nombres = almacen.obtener("nombres")
+
+    def nombre_de(uid):
+        return nombres.get(str(uid), {}).get("nombre", "")
+
+    if nombre == "historial":
+        for entry in almacen.iterar_historial():
+            if formato == "jsonl":
+                yield entry
+                continue
+            for rol, miembros in entry.get("roles", {}).items():
+                for m in miembros:
+                    yield {
+                        "fecha": entry.get("fecha"), "hora": entry.get("hora"), "leader_id": entry.get("leader_id"),
+                        "descuento": entry.get("descuento", 0), "rol": rol, "uid": m["id"], "nombre": m.get("nombre", ""),
+                    }
+    elif nombre == "bans":
+        for uid in almacen.obtener("bans"):
+            yield {"uid": uid, "nombre": nombre_de(uid)}
+    else:
+        for uid, datos in almacen.obtener(nombre).items():
+            yield {"uid": uid, "nombre": nombre_de(uid), **datos}
+
+def exportar(almacen, args, salida):
+    formato = formato_de(args)
+    escritor = csv.DictWriter(salida, fieldnames=COLUMNAS[args.coleccion], extrasaction="ignore") if formato == "csv" else None
+    if escritor:
+        escritor.writeheader()
+    cantidad = 0
+    for fila in filas_exportacion(almacen, args.coleccion, formato):
+        if escritor:
+            escritor.writerow(fila)
+        else:
+            salida.write(json.dumps(fila, ensure_ascii=False) + "\n")
+        cantidad += 1
+    print(f"✅ {cantidad} registros exportados.", file=sys.stderr)
+    return 0
+
+# ======================
+# ENTRADA
+# ======================
+def main():
+    parser = argparse.ArgumentParser(description="Importa y exporta puntos, multas, bans e historial de un gremio")
+    acciones = parser.add_subparsers(dest="accion", required=True)
+    for accion in ("exportar", "importar"):
+        sub = acciones.add_parser(accion)
+        sub.add_argument("coleccion", choices=tuple(COLUMNAS))
+        sub.add_argument("--guild", type=int, required=True)
+        sub.add_argument("--archivo", default="-", help="ruta, o - para stdin/stdout")
+        sub.add_argument("--formato", choices=("csv", "jsonl"), help="por defecto sale de la extension (.jsonl o csv)")
+    sub = acciones.choices["importar"]
+    sub.add_argument("--modo", choices=("fijar", "ajustar", "reemplazar"), default="fijar",
+                     help="fijar: valores absolutos por miembro; ajustar: uid,valor como !score/!multa; "
+                          "reemplazar: la coleccion queda igual al archivo")
+    sub.add_argument("--actor", help="id que queda como autor en el libro de movimientos")
+    sub.add_argument("--saltar-invalidas", action="store_true", help="aplica lo valido y solo informa lo demas")
+    sub.add_argument("--simular", action="store_true", help="valida y cuenta sin escribir nada")
+    args = parser.parse_args()
+
+    if args.accion == "importar":
+        if args.modo == "ajustar" and args.coleccion not in CAMPOS:
+            parser.error("--modo ajustar solo aplica a puntos y multas")
+        if args.coleccion == "historial" and (args.modo != "fijar" or formato_de(args) != "jsonl"):
+            parser.error("el historial se importa solo en jsonl y agregando parties (sin --modo)")
+
+    # bot.py lee la configuracion del entorno al importarse
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import bot
+
+    almacen = bot.almacen_de(args.guild)
+    if args.accion == "exportar":
+        try:
+            if args.archivo == "-":
+                try:
+                    return exportar(almacen, args, sys.stdout)
+                except BrokenPipeError:
+                    # La salida se corto antes (por ejemplo con | head): no es un error
+                    sys.stdout = open(os.devnull, "w")
+                    return 0
+            with open(args.archivo, "w", encoding="utf-8", newline="") as f:
+                return exportar(almacen, args, f)
+        finally:
+            almacen.backend.cerrar()
+            if almacen.libro is not None:
+                almacen.libro.cerrar()
+
+    try:
+        return asyncio.run(importar(bot, almacen, args))
+    finally:
+        almacen.cerrar()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,408 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+# ======================
+# HARNESS DE CARGA OFFLINE
+# ======================
+# Uso: python harness.py [--parties 4] [--miembros 40] [--latencia-api 0.05]
+#                        [--grabar eventos.jsonl | --reproducir eventos.jsonl]
+# Reproduce un stream de eventos del gateway contra los handlers de bot.py
+# usando un cliente falso, sin conectarse a Discord.
+
+ROL_LIDER = "Capitan"
+ROL_MIEMBRO = "Miembro"
+ids = itertools.count(900000000000000000)
+
+# ======================
+# DISCORD FALSO
+# ======================
+class API:
+    # Cuenta cada llamada saliente y simula la latencia de un round trip REST
+    def __init__(self, latencia):
+        self.latencia = latencia
+        self.llamadas = Counter()
+
+    async def llamar(self, tipo):
+        self.llamadas[tipo] += 1
+        if self.latencia:
+            await asyncio.sleep(self.latencia)
+
+class RolFalso:
+    def __init__(self, name):
+        self.name = name
+
+class MiembroFalso:
+    def __init__(self, member_id, nombre, roles=(), guild=None):
+        self.id = member_id
+        self.guild = guild
+        self.display_name = nombre
+        self.name = nombre
+        self.bot = False
+        self.roles = [RolFalso(r) for r in roles]
+        self.mention = f"<@{member_id}>"
+
+class MensajeFalso:
+    def __init__(self, api, canal, embed=None):
+        self.api = api
+        self.id = next(ids)
+        self.channel = canal
+        self.guild = canal.guild
+        self.embeds = [embed] if embed else []
+
+    async def edit(self, **kwargs):
+        await self.api.llamar("message.edit")
+        if kwargs.get("embed") is not None:
+            self.embeds = [kwargs["embed"]]
+
+    async def add_reaction(self, emoji):
+        await self.api.llamar("message.add_reaction")
+
+    async def clear_reactions(self):
+        await self.api.llamar("message.clear_reactions")
+
+    async def reply(self, content=None, **kwargs):
+        await self.api.llamar("message.reply")
+
+    async def create_thread(self, name):
+        await self.api.llamar("message.create_thread")
+
+class CanalFalso:
+    def __init__(self, api, guild, canal_id, name):
+        self.api = api
+        self.guild = guild
+        self.id = canal_id
+        self.name = name
+        self.mensajes = {}
+
+    async def send(self, content=None, embed=None, view=None, **kwargs):
+        await self.api.llamar("channel.send")
+        msg = MensajeFalso(self.api, self, embed)
+        self.mensajes[msg.id] = msg
+        return msg
+
+    async def fetch_message(self, msg_id):
+        await self.api.llamar("channel.fetch_message")
+        return self.mensajes[msg_id]
+
+class GuildFalso:
+    def __init__(self, api, guild_id, roles):
+        self.id = guild_id
+        self.name = "Gremio de prueba"
+        self.chunked = True
+        self.text_channels = [CanalFalso(api, self, next(ids), f"b-{rol}") for rol in roles]
+        self.general = CanalFalso(api, self, next(ids), "general")
+        self.text_channels.append(self.general)
+        self.miembros = {}
+
+    @property
+    def members(self):
+        return list(self.miembros.values())
+
+    def get_member(self, member_id):
+        return self.miembros.get(member_id)
+
+    def get_channel(self, canal_id):
+        return next((c for c in self.text_channels if c.id == canal_id), None)
+
+class RespuestaFalsa:
+    def __init__(self, api):
+        self.api = api
+        self.hecha = False
+
+    async def send_message(self, *args, **kwargs):
+        self.hecha = True
+        await self.api.llamar("interaction.response")
+
+    async def defer(self, *args, **kwargs):
+        self.hecha = True
+        await self.api.llamar("interaction.response")
+
+    async def edit_message(self, **kwargs):
+        self.hecha = True
+        await self.api.llamar("interaction.response")
+
+    def is_done(self):
+        return self.hecha
+
+class SeguimientoFalso:
+    def __init__(self, api):
+        self.api = api
+
+    async def send(self, *args, **kwargs):
+        await self.api.llamar("interaction.followup")
+
+class InteraccionFalsa:
+    def __init__(self, api, usuario, mensaje):
+        self.id = next(ids)
+        self.user = usuario
+        self.message = mensaje
+        self.guild = mensaje.guild
+        self.channel = mensaje.channel
+        self.response = RespuestaFalsa(api)
+        self.followup = SeguimientoFalso(api)
+        self.data = {}
+
+class MensajeComandoFalso:
+    def __init__(self, menciones):
+        self.mentions = menciones
+
+class ContextoFalso:
+    def __init__(self, autor, guild, canal, menciones=()):
+        self.author = autor
+        self.guild = guild
+        self.channel = canal
+        self.message = MensajeComandoFalso(list(menciones))
+
+    async def send(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
+
+class PayloadFalso:
+    def __init__(self, guild, canal_id, msg_id, miembro, emoji):
+        self.guild_id = guild.id
+        self.channel_id = canal_id
+        self.message_id = msg_id
+        self.user_id = miembro.id
+        self.member = miembro
+        self.emoji = emoji
+
+# ======================
+# GENERACION DE EVENTOS
+# ======================
+def generar_eventos(parties, miembros, rng, roles, reacciones):
+    eventos = []
+    t = 0.0
+    for p in range(parties):
+        eventos.append({"t": round(t, 3), "tipo": "wb", "party": p, "hora": f"{18 + p % 6:02d}00"})
+        t += 0.2
+    # Rafaga de anotaciones: cada miembro reacciona en los primeros segundos
+    for p in range(parties):
+        for m in range(miembros):
+            eventos.append({"t": round(t + rng.uniform(0, 3), 3), "tipo": "reaccion_add", "party": p,
+                            "miembro": m, "emoji": rng.choice(reacciones)})
+    t += 3.5
+    # Cambios de rol (add nuevo + remove viejo) y bajas
+    for p in range(parties):
+        for m in rng.sample(range(miembros), miembros // 4):
+            eventos.append({"t": round(t + rng.uniform(0, 2), 3), "tipo": "cambio_rol", "party": p,
+                            "miembro": m, "emoji": rng.choice(reacciones)})
+        for m in rng.sample(range(miembros), miembros // 10):
+            eventos.append({"t": round(t + rng.uniform(0, 2), 3), "tipo": "reaccion_remove", "party": p,
+                            "miembro": m})
+    t += 2.5
+    eventos.append({"t": round(t, 3), "tipo": "score", "miembros": list(range(min(miembros, 50))), "valor": 5})
+    for p in range(parties):
+        for boton in ("sumar", "sumar", "restar", "iniciar"):
+            t += 0.1
+            eventos.append({"t": round(t, 3), "tipo": "boton", "party": p, "boton": boton})
+    for p in range(parties):
+        t += 0.1
+        eventos.append({"t": round(t, 3), "tipo": "boton", "party": p, "boton": "finalizar"})
+    eventos.sort(key=lambda e: e["t"])
+    return eventos
+
+# ======================
+# REPRODUCCION
+# ======================
+class Harness:
+    def __init__(self, bot, api, miembros):
+        self.bot = bot
+        self.api = api
+        self.guild = GuildFalso(api, next(ids), bot.WB_ROLES)
+        self.lider = MiembroFalso(next(ids), "Lider", [ROL_LIDER], self.guild)
+        self.guild.miembros[self.lider.id] = self.lider
+        self.miembros = []
+        for i in range(miembros):
+            m = MiembroFalso(next(ids), f"Miembro {i}", [ROL_MIEMBRO], self.guild)
+            self.guild.miembros[m.id] = m
+            self.miembros.append(m)
+        self.parties = {}
+        self.reaccion_actual = {}
+        self.latencias = defaultdict(list)
+        self.errores = Counter()
+
+        bot.bot.get_guild = lambda guild_id: self.guild if guild_id == self.guild.id else None
+        bot.construir_canales_roles(self.guild)
+        puntos = bot.cargar_puntos(self.guild.id)
+        for m in self.miembros:
+            puntos[str(m.id)] = {"puntos_actuales": 10, "puntos_obtenidos": 10, "puntos_usados": 0}
+        bot.guardar_puntos(self.guild.id, puntos)
+
+    async def despachar(self, evento):
+        inicio = time.perf_counter()
+        try:
+            await getattr(self, f"_evento_{evento['tipo']}")(evento)
+        except Exception as e:
+            self.errores[f"{evento['tipo']}: {type(e).__name__}: {e}"] += 1
+        self.latencias[evento["tipo"]].append((time.perf_counter() - inicio) * 1000)
+
+    async def _evento_wb(self, evento):
+        ctx = ContextoFalso(self.lider, self.guild, self.guild.general)
+        antes = set(self.guild.general.mensajes)
+        await self.bot.wb.callback(ctx, evento["hora"])
+        nuevo = next(m for m in self.guild.general.mensajes if m not in antes)
+        self.parties[evento["party"]] = self.guild.general.mensajes[nuevo]
+
+    async def _reaccion(self, handler, party, miembro, emoji):
+        msg = self.parties[party]
+        payload = PayloadFalso(self.guild, msg.channel.id, msg.id, self.miembros[miembro], emoji)
+        await handler(payload)
+
+    async def _componente(self, party, miembro, emoji):
+        # Modo de inscripcion por componentes: una interaccion por cambio
+        from discord.ui.select import selected_values
+
+        msg = self.parties[party]
+        rol = self.bot.WB_ROLES[self.bot.REACTIONS.index(emoji)] if emoji else None
+        vista = self.bot.ControlButtons(inscripcion=self.bot.MODO_INSCRIPCION)
+        if self.bot.MODO_INSCRIPCION == "menu":
+            custom_id = "wb:rol"
+            selected_values.set({custom_id: [rol or "_salir"]})
+        else:
+            custom_id = f"wb:rol:{rol}" if rol else "wb:salir"
+        item = next(i for i in vista.children if getattr(i, "custom_id", None) == custom_id)
+        await item.callback(InteraccionFalsa(self.api, self.miembros[miembro], msg))
+
+    async def _evento_reaccion_add(self, evento):
+        if self.bot.MODO_INSCRIPCION != "reacciones":
+            await self._componente(evento["party"], evento["miembro"], evento["emoji"])
+        else:
+            await self._reaccion(self.bot.on_raw_reaction_add, evento["party"], evento["miembro"], evento["emoji"])
+        self.reaccion_actual[(evento["party"], evento["miembro"])] = evento["emoji"]
+
+    async def _evento_reaccion_remove(self, evento):
+        emoji = self.reaccion_actual.pop((evento["party"], evento["miembro"]), None)
+        if not emoji:
+            return
+        if self.bot.MODO_INSCRIPCION != "reacciones":
+            await self._componente(evento["party"], evento["miembro"], None)
+        else:
+            await self._reaccion(self.bot.on_raw_reaction_remove, evento["party"], evento["miembro"], emoji)
+
+    async def _evento_cambio_rol(self, evento):
+        anterior = self.reaccion_actual.get((evento["party"], evento["miembro"]))
+        if anterior == evento["emoji"]:
+            return
+        await self._evento_reaccion_add(evento)
+        if anterior and self.bot.MODO_INSCRIPCION == "reacciones":
+            await self._reaccion(self.bot.on_raw_reaction_remove, evento["party"], evento["miembro"], anterior)
+
+    async def _evento_boton(self, evento):
+        msg = self.parties[evento["party"]]
+        vista = self.bot.ControlButtons(inscripcion=self.bot.MODO_INSCRIPCION)
+        boton = next(b for b in vista.children if getattr(b, "custom_id", None) == f"wb:{evento['boton']}")
+        await boton.callback(InteraccionFalsa(self.api, self.lider, msg))
+
+    async def _evento_score(self, evento):
+        menciones = [self.miembros[i] for i in evento["miembros"]]
+        ctx = ContextoFalso(self.lider, self.guild, self.guild.general, menciones)
+        await self.bot.score.callback(ctx, *(m.mention for m in menciones), str(evento["valor"]))
+
+async def medir_lag(muestras, intervalo, parar):
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        await asyncio.sleep(intervalo)
+        muestras.append(max(0.0, (time.perf_counter() - inicio - intervalo) * 1000))
+
+def percentiles(valores):
+    if not valores:
+        return {}
+    ordenados = sorted(valores)
+    def p(q):
+        return round(ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))], 3)
+    return {"n": len(valores), "p50": p(0.50), "p90": p(0.90), "p99": p(0.99),
+            "max": round(ordenados[-1], 3), "media": round(statistics.fmean(valores), 3)}
+
+async def reproducir(bot, eventos, api, miembros, velocidad):
+    harness = Harness(bot, api, miembros)
+    lag = []
+    parar = asyncio.Event()
+    sampler = asyncio.create_task(medir_lag(lag, 0.01, parar))
+
+    inicio = time.perf_counter()
+    tareas = []
+    for evento in eventos:
+        if velocidad:
+            espera = evento["t"] / velocidad - (time.perf_counter() - inicio)
+            if espera > 0:
+                await asyncio.sleep(espera)
+        # Como el gateway, cada evento se despacha en su propia tarea
+        tareas.append(asyncio.create_task(harness.despachar(evento)))
+        if evento["tipo"] == "wb":
+            await tareas[-1]
+    await asyncio.gather(*tareas)
+    # Deja salir las ediciones que quedaron agrupadas
+    await asyncio.sleep(bot.editor_embeds.ventana + max(api.latencia, 0.01) * 2)
+    while bot.salida.workers:
+        await asyncio.gather(*bot.salida.workers.values())
+    duracion = time.perf_counter() - inicio
+
+    parar.set()
+    await sampler
+    return {
+        "eventos": len(eventos),
+        "duracion_s": round(duracion, 3),
+        "latencia_ms": {tipo: percentiles(v) for tipo, v in sorted(harness.latencias.items())},
+        "llamadas_api": dict(api.llamadas),
+        "llamadas_api_total": sum(api.llamadas.values()),
+        "lag_loop_ms": percentiles(lag),
+        "ediciones_embed": dict(bot.editor_embeds.stats),
+        "cola_salida": dict(bot.salida.stats),
+        "errores": dict(harness.errores),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Harness de carga offline para bot.py")
+    parser.add_argument("--parties", type=int, default=4)
+    parser.add_argument("--miembros", type=int, default=40)
+    parser.add_argument("--latencia-api", type=float, default=0.05, help="segundos por llamada REST simulada")
+    parser.add_argument("--velocidad", type=float, default=1.0, help="factor de tiempo; 0 despacha todo sin esperar")
+    parser.add_argument("--semilla", type=int, default=1234)
+    parser.add_argument("--grabar", help="guarda el stream generado en este .jsonl")
+    parser.add_argument("--reproducir", help="reproduce un stream grabado en vez de generar uno")
+    parser.add_argument("--salida", help="escribe el reporte JSON en este archivo")
+    parser.add_argument("--inscripcion", choices=("reacciones", "menu", "botones"), default="reacciones")
+    args = parser.parse_args()
+
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    rutas = {k: os.path.abspath(v) for k, v in vars(args).items() if k in ("grabar", "reproducir", "salida") and v}
+
+    # bot.py lee la configuracion del entorno y abre sus archivos al importarse
+    os.environ.setdefault("ROL_CAPITAN", ROL_LIDER)
+    os.environ.setdefault("ROL_MIEMBRO", ROL_MIEMBRO)
+    os.environ.setdefault("PREFIX", "!")
+    os.environ["MODO_INSCRIPCION"] = args.inscripcion
+    sys.path.insert(0, raiz)
+    os.chdir(tempfile.mkdtemp(prefix="harness-bot-"))
+    import bot
+
+    if "reproducir" in rutas:
+        with open(rutas["reproducir"], "r", encoding="utf-8") as f:
+            eventos = [json.loads(linea) for linea in f if linea.strip()]
+        miembros = max([e.get("miembro", 0) for e in eventos] + [args.miembros - 1]) + 1
+    else:
+        rng = random.Random(args.semilla)
+        eventos = generar_eventos(args.parties, args.miembros, rng, bot.WB_ROLES, bot.REACTIONS)
+        miembros = args.miembros
+    if "grabar" in rutas:
+        with open(rutas["grabar"], "w", encoding="utf-8") as f:
+            for evento in eventos:
+                f.write(json.dumps(evento) + "\n")
+
+    reporte = asyncio.run(reproducir(bot, eventos, API(args.latencia_api), miembros, args.velocidad))
+    texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+    if "salida" in rutas:
+        with open(rutas["salida"], "w", encoding="utf-8") as f:
+            f.write(texto)
+    print(texto)
+
+if __name__ == "__main__":
+    main()
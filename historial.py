@@ -0,0 +1,163 @@
+import json
+import os
+import struct
+import threading
+from array import array
+
+# Cada offset del indice ocupa 8 bytes, asi la entrada n esta en n * 8
+FORMATO_OFFSET = ">Q"
+TAM_OFFSET = struct.calcsize(FORMATO_OFFSET)
+
+def fecha_iso(fecha):
+    # Las parties guardan la fecha como dd/mm/YYYY
+    try:
+        dia, mes, anio = fecha.split("/")
+        return f"{anio}-{mes}-{dia}"
+    except (AttributeError, ValueError):
+        return None
+
+def claves_historial(entry):
+    # Filtros por los que se puede buscar una party: (tipo, valor)
+    claves = [("leader", str(entry.get("leader_id")))]
+    fecha = fecha_iso(entry.get("fecha"))
+    if fecha:
+        claves.append(("mes", fecha[:7]))
+    for miembros in entry.get("roles", {}).values():
+        for m in miembros:
+            claves.append(("miembro", str(m["id"])))
+    return claves
+
+# ======================
+# HISTORIAL APPEND-ONLY
+# ======================
+class HistorialLog:
+    # Las parties se agregan al final de un .jsonl (una por linea) y su
+    # offset se agrega al .idx; leer una pagina es un seek directo.
+    def __init__(self, base, legado=None):
+        raiz, _ = os.path.splitext(base)
+        self.ruta_log = raiz + ".jsonl"
+        self.ruta_idx = raiz + ".idx"
+        nuevo = not os.path.exists(self.ruta_log)
+        # agregar() puede correr en el hilo de volcado mientras el loop lee
+        self.lock = threading.Lock()
+        self.log = open(self.ruta_log, "a+b")
+        self.offsets = self._cargar_indice()
+        # (tipo, valor) -> numeros de entrada en orden de llegada
+        self.secundarios = None
+        self.idx = open(self.ruta_idx, "ab")
+        if nuevo and legado and os.path.exists(legado):
+            with open(legado, "r", encoding="utf-8") as f:
+                historial = json.load(f)
+            # El archivo viejo guarda la party mas reciente primero
+            for entry in reversed(historial):
+                self.agregar(entry)
+
+    def _cargar_indice(self):
+        offsets = array("Q")
+        if os.path.exists(self.ruta_idx):
+            with open(self.ruta_idx, "rb") as f:
+                crudo = f.read()
+            for (offset,) in struct.iter_unpack(FORMATO_OFFSET, crudo[:len(crudo) - len(crudo) % TAM_OFFSET]):
+                offsets.append(offset)
+
+        tam_log = os.path.getsize(self.ruta_log)
+        if offsets and offsets[-1] >= tam_log:
+            offsets = array("Q")
+
+        # Si el proceso murio entre el append al log y el del indice, se
+        # indexa solo la cola que falta; una linea cortada se descarta.
+        inicio = offsets.pop() if offsets else 0
+        self.log.seek(inicio)
+        pos = inicio
+        for linea in self.log:
+            if not linea.endswith(b"\n"):
+                break
+            offsets.append(pos)
+            pos += len(linea)
+        if pos < tam_log:
+            self.log.truncate(pos)
+
+        with open(self.ruta_idx, "wb") as f:
+            f.write(b"".join(struct.pack(FORMATO_OFFSET, o) for o in offsets))
+        return offsets
+
+    def agregar(self, entry):
+        return self.agregar_lote([entry])
+
+    def agregar_lote(self, entries):
+        # Un solo write al log y otro al indice para todo el lote; devuelve
+        # el numero de la primera entrada
+        lineas = [(json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8") for entry in entries]
+        with self.lock:
+            self.log.seek(0, os.SEEK_END)
+            offset = self.log.tell()
+            offsets = []
+            for linea in lineas:
+                offsets.append(offset)
+                offset += len(linea)
+            self.log.write(b"".join(lineas))
+            self.log.flush()
+            self.idx.write(b"".join(struct.pack(FORMATO_OFFSET, o) for o in offsets))
+            self.idx.flush()
+            primero = len(self.offsets)
+            self.offsets.extend(offsets)
+            if self.secundarios is not None:
+                for numero, entry in enumerate(entries, primero):
+                    self._indexar(self.secundarios, numero, entry)
+            return primero
+
+    def _indexar(self, secundarios, numero, entry):
+        for clave in set(claves_historial(entry)):
+            secundarios.setdefault(clave, array("Q")).append(numero)
+
+    def _secundarios(self):
+        # Se arman con una pasada la primera vez que se filtra y desde ahi
+        # agregar() los mantiene; el lock evita perder una party que entra
+        # mientras se arman.
+        with self.lock:
+            if self.secundarios is None:
+                secundarios = {}
+                total = len(self.offsets)
+                for numero, entry in enumerate(self.iterar()):
+                    if numero >= total:
+                        break
+                    self._indexar(secundarios, numero, entry)
+                self.secundarios = secundarios
+            return self.secundarios
+
+    def preparar(self):
+        # Arma los indices por filtro de una vez; se llama desde un hilo al
+        # cargar la particion para que el primer filtro no recorra el log en el loop
+        self._secundarios()
+
+    def contar(self, filtro=None):
+        if filtro is None:
+            return len(self.offsets)
+        return len(self._secundarios().get(filtro, ()))
+
+    def leer_numero(self, numero):
+        # numero es el orden de llegada: 0 es la party mas vieja
+        with self.lock:
+            self.log.seek(self.offsets[numero])
+            linea = self.log.readline()
+        return json.loads(linea)
+
+    def leer(self, pos, filtro=None):
+        # pos 0 es la party mas reciente (de las que pasan el filtro)
+        numeros = self.offsets if filtro is None else self._secundarios().get(filtro, ())
+        if not 0 <= pos < len(numeros):
+            raise IndexError(pos)
+        if filtro is None:
+            return self.leer_numero(len(numeros) - 1 - pos)
+        return self.leer_numero(numeros[len(numeros) - 1 - pos])
+
+    def iterar(self):
+        # Handle propio para no pelear el seek con agregar() y leer()
+        with open(self.ruta_log, "rb") as f:
+            for linea in f:
+                if linea.endswith(b"\n"):
+                    yield json.loads(linea)
+
+    def cerrar(self):
+        self.log.close()
+        self.idx.close()
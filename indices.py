@@ -0,0 +1,172 @@
+from bisect import bisect_left, insort
+
+# ======================
+# ROSTER DE PARTY
+# ======================
+class Roster:
+    # Mapa miembro -> rol y, por rol, una lista ordenada por puntos
+    # (de mayor a menor, con orden de llegada para los empates).
+    def __init__(self, roles):
+        self.roles = roles
+        self.listas = {rol: [] for rol in roles}
+        self.por_miembro = {}
+        self.nombres = {}
+        self._orden = 0
+
+    def __len__(self):
+        return len(self.por_miembro)
+
+    def __contains__(self, miembro_id):
+        return miembro_id in self.por_miembro
+
+    def rol_de(self, miembro_id):
+        actual = self.por_miembro.get(miembro_id)
+        return actual[0] if actual else None
+
+    def agregar(self, miembro_id, nombre, rol, puntos):
+        self.quitar(miembro_id)
+        self._orden += 1
+        self._insertar(miembro_id, rol, (-puntos, self._orden, miembro_id))
+        self.nombres[miembro_id] = nombre
+
+    def _insertar(self, miembro_id, rol, clave):
+        insort(self.listas[rol], clave)
+        self.por_miembro[miembro_id] = (rol, clave)
+
+    def _sacar(self, miembro_id):
+        rol, clave = self.por_miembro.pop(miembro_id)
+        lista = self.listas[rol]
+        del lista[bisect_left(lista, clave)]
+        return rol, clave
+
+    def quitar(self, miembro_id):
+        if miembro_id not in self.por_miembro:
+            return None
+        rol, _ = self._sacar(miembro_id)
+        self.nombres.pop(miembro_id, None)
+        return rol
+
+    def reordenar(self, miembro_id, puntos):
+        # Cambiaron los puntos del miembro: se reubica sin perder su orden de llegada
+        if miembro_id not in self.por_miembro:
+            return
+        rol, clave = self._sacar(miembro_id)
+        self._insertar(miembro_id, rol, (-puntos, clave[1], miembro_id))
+
+    def miembros(self, rol):
+        return [(miembro_id, self.nombres[miembro_id]) for _, _, miembro_id in self.listas[rol]]
+
+    def como_dict(self):
+        return {
+            rol: [{"id": miembro_id, "nombre": nombre} for miembro_id, nombre in self.miembros(rol)]
+            for rol in self.roles
+        }
+
+    @classmethod
+    def desde_dict(cls, roles, data, puntos_de):
+        roster = cls(roles)
+        for rol in roles:
+            for m in data.get(rol, []):
+                roster.agregar(m["id"], m["nombre"], rol, puntos_de(m["id"]))
+        return roster
+
+# ======================
+# RANKING DE PUNTOS
+# ======================
+class IndiceRanking:
+    # Lista ordenada de (-valor, uid) que se actualiza por miembro, asi el
+    # top y cualquier pagina salen de un slice sin ordenar todo el gremio.
+    def __init__(self, campo):
+        self.campo = campo
+        self.orden = []
+        self.claves = {}
+
+    def __len__(self):
+        return len(self.orden)
+
+    def reconstruir(self, data):
+        self.claves = {uid: (-d.get(self.campo, 0), uid) for uid, d in data.items()}
+        self.orden = sorted(self.claves.values())
+
+    def actualizar(self, data, claves=None):
+        if claves is None:
+            return self.reconstruir(data)
+        for uid in claves:
+            uid = str(uid)
+            anterior = self.claves.pop(uid, None)
+            if anterior is not None:
+                del self.orden[bisect_left(self.orden, anterior)]
+            if uid in data:
+                clave = (-data[uid].get(self.campo, 0), uid)
+                insort(self.orden, clave)
+                self.claves[uid] = clave
+
+    def posicion(self, uid):
+        clave = self.claves.get(str(uid))
+        return bisect_left(self.orden, clave) if clave else None
+
+    def rango(self, inicio, cantidad):
+        return [(uid, -valor) for valor, uid in self.orden[inicio:inicio + cantidad]]
+
+    def top(self, cantidad):
+        return self.rango(0, cantidad)
+
+# ======================
+# ESTADO DE MIEMBROS
+# ======================
+# Posicion en la tupla de estado y campo de donde sale, por coleccion
+CAMPOS_ESTADO = {"puntos": (0, "puntos_actuales"), "multas": (1, "deuda"), "bans": (2, None)}
+
+class IndiceEstado:
+    # uid -> (puntos_actuales, deuda, baneado): todo lo que el roster mira de
+    # un miembro en una sola busqueda. Se registra una vista por coleccion y
+    # cada una mantiene su parte de la tupla.
+    VACIO = (0, 0.0, False)
+
+    def __init__(self):
+        self.estados = {}
+
+    def __len__(self):
+        return len(self.estados)
+
+    def vista(self, nombre):
+        return VistaEstado(self, *CAMPOS_ESTADO[nombre])
+
+    def estado(self, uid):
+        return self.estados.get(str(uid), self.VACIO)
+
+    def poner(self, uid, posicion, valor):
+        estado = list(self.estados.get(uid, self.VACIO))
+        estado[posicion] = valor
+        estado = tuple(estado)
+        if estado == self.VACIO:
+            self.estados.pop(uid, None)
+        else:
+            self.estados[uid] = estado
+
+class VistaEstado:
+    def __init__(self, indice, posicion, campo):
+        self.indice = indice
+        self.posicion = posicion
+        self.campo = campo
+
+    def _valor(self, data, uid):
+        if self.campo is None:
+            return uid in data
+        return data.get(uid, {}).get(self.campo, IndiceEstado.VACIO[self.posicion])
+
+    def reconstruir(self, data):
+        vacio = IndiceEstado.VACIO[self.posicion]
+        for uid in [uid for uid, estado in self.indice.estados.items() if estado[self.posicion] != vacio]:
+            self.indice.poner(uid, self.posicion, vacio)
+        presentes = data if isinstance(data, dict) else set(data)
+        for uid in presentes:
+            self.indice.poner(uid, self.posicion, self._valor(presentes, uid))
+
+    def actualizar(self, data, claves=None):
+        if claves is None:
+            return self.reconstruir(data)
+        # bans es una lista, pero solo se tocan los uids que cambiaron
+        for uid in claves:
+            uid = str(uid)
+            self.indice.poner(uid, self.posicion, self._valor(data, uid))
@@ -0,0 +1,163 @@
+import json
+import os
+import time
+
+from almacen import escribir_json_atomico, leer_json
+
+# ======================
+# LIBRO DE MOVIMIENTOS
+# ======================
+def primer_seq(ruta):
+    return int(os.path.basename(ruta)[:-len(".jsonl")])
+
+def leer_segmento(ruta):
+    # Una linea sin "\n" al final es una escritura cortada: se ignora
+    with open(ruta, "rb") as f:
+        for linea in f:
+            if linea.endswith(b"\n"):
+                yield json.loads(linea)
+
+def leer_segmento_al_reves(ruta, bloque=1 << 16):
+    # Del ultimo registro al primero, por bloques desde el final: cortar
+    # despues de unos pocos registros no lee el resto del segmento
+    with open(ruta, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        resto = b""
+        # Hasta el primer "\n" desde el final lo leido es una linea cortada
+        cortada = True
+        while pos > 0:
+            leer = min(bloque, pos)
+            pos -= leer
+            f.seek(pos)
+            lineas = (f.read(leer) + resto).split(b"\n")
+            resto = lineas.pop(0)
+            if lineas and cortada:
+                lineas.pop()
+                cortada = False
+            for linea in reversed(lineas):
+                if linea:
+                    yield json.loads(linea)
+        if resto and not cortada:
+            yield json.loads(resto)
+
+class Libro:
+    # Cada cambio de puntos o multas se agrega como un registro a un segmento
+    # .jsonl. El registro lleva el valor absoluto que quedo (y el delta y quien
+    # lo hizo, para auditar), asi reproducir la cola sobre un snapshot da lo
+    # mismo aunque el snapshot ya incluya parte de ella. Con cada snapshot se
+    # abre un segmento nuevo y la recuperacion solo lee desde el ultimo.
+    def __init__(self, directorio, colecciones=("puntos", "multas"), cada=1000):
+        self.directorio = directorio
+        self.colecciones = colecciones
+        self.cada = cada
+        os.makedirs(directorio, exist_ok=True)
+        self.ruta_marca = os.path.join(directorio, "snapshot.json")
+        self.snapshot = leer_json(self.ruta_marca, dict).get("seq", 0)
+        self.seq = self.snapshot
+        self.pendientes = []
+        self.desde_snapshot = 0
+        segmentos = self.segmentos()
+        self.actual = segmentos[-1] if segmentos else None
+        self.archivo = None
+
+    def segmentos(self):
+        nombres = sorted(n for n in os.listdir(self.directorio) if n.endswith(".jsonl"))
+        return [os.path.join(self.directorio, n) for n in nombres]
+
+    def cola(self):
+        # Registros posteriores al snapshot, en orden; los duplicados de un
+        # reintento de escritura se saltean por seq
+        segmentos = self.segmentos()
+        inicio = 0
+        for i, ruta in enumerate(segmentos):
+            if primer_seq(ruta) <= self.snapshot + 1:
+                inicio = i
+        for ruta in segmentos[inicio:]:
+            for registro in leer_segmento(ruta):
+                if registro["s"] <= self.seq:
+                    continue
+                self.seq = registro["s"]
+                self.desde_snapshot += 1
+                yield registro
+
+    def anotar(self, coleccion, uid, valor, delta=None, actor=None):
+        # uid None: el valor es la coleccion entera (por ejemplo un scorereset)
+        self.seq += 1
+        registro = {"s": self.seq, "t": int(time.time()), "c": coleccion, "u": uid, "v": valor}
+        if delta is not None:
+            registro["d"] = delta
+        if actor is not None:
+            registro["a"] = str(actor)
+        self.pendientes.append(registro)
+        self.desde_snapshot += 1
+
+    def tomar(self):
+        registros, self.pendientes = self.pendientes, []
+        return registros
+
+    def devolver(self, registros):
+        self.pendientes[:0] = registros
+
+    # ======================
+    # ESCRITURA (hilo de volcado)
+    # ======================
+    def _abrir(self, seq):
+        if self.actual is None:
+            self.actual = os.path.join(self.directorio, f"{seq:012d}.jsonl")
+        self.archivo = open(self.actual, "ab+")
+        # Si el ultimo corte dejo una linea a medias se recorta antes de seguir
+        tamano = self.archivo.seek(0, os.SEEK_END)
+        if tamano:
+            self.archivo.seek(tamano - 1)
+            if self.archivo.read(1) != b"\n":
+                self.archivo.seek(0)
+                contenido = self.archivo.read()
+                self.archivo.truncate(contenido.rfind(b"\n") + 1)
+        self.archivo.seek(0, os.SEEK_END)
+
+    def escribir(self, registros):
+        # Group commit: todo lo juntado desde el volcado anterior va en un
+        # solo write y un solo fsync
+        if not registros:
+            return
+        if self.archivo is None:
+            self._abrir(registros[0]["s"])
+        self.archivo.write(b"".join(
+            json.dumps(r, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n" for r in registros
+        ))
+        self.archivo.flush()
+        os.fsync(self.archivo.fileno())
+
+    def rotar(self, seq):
+        # Se llama con el snapshot de las colecciones ya en disco
+        escribir_json_atomico(self.ruta_marca, {"seq": seq})
+        self.snapshot = seq
+        self.cerrar()
+        self.actual = None
+
+    def recientes(self, cantidad, uid=None, segmentos=8):
+        # Del mas nuevo al mas viejo, cortando apenas se junta la cantidad.
+        # Como mucho se miran los ultimos segmentos (un snapshot cada uno):
+        # lo de un miembro que no se toca hace mucho no se busca en todo el libro
+        pendientes = list(self.pendientes)
+
+        def registros():
+            yield from reversed(pendientes)
+            for ruta in self.segmentos()[::-1][:segmentos]:
+                yield from leer_segmento_al_reves(ruta)
+
+        encontrados = []
+        vistos = set()
+        for registro in registros():
+            if registro["s"] in vistos or (uid is not None and registro["u"] not in (uid, None)):
+                continue
+            vistos.add(registro["s"])
+            encontrados.append(registro)
+            if len(encontrados) == cantidad:
+                break
+        return encontrados
+
+    def cerrar(self):
+        if self.archivo is not None:
+            self.archivo.close()
+            self.archivo = None
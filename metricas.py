@@ -0,0 +1,184 @@
+import asyncio
+import functools
+import logging
+import time
+from collections import defaultdict
+
+# Limites de los buckets de latencia, en milisegundos
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# ======================
+# HISTOGRAMAS Y CONTADORES
+# ======================
+class Histograma:
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.conteos = [0] * (len(buckets) + 1)
+        self.suma = 0.0
+        self.total = 0
+        self.maximo = 0.0
+
+    def observar(self, valor):
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.conteos[i] += 1
+                break
+        else:
+            self.conteos[-1] += 1
+        self.suma += valor
+        self.total += 1
+        self.maximo = max(self.maximo, valor)
+
+    def cuantil(self, q):
+        # Aproximado: el limite superior del bucket donde cae el cuantil
+        if not self.total:
+            return 0.0
+        objetivo = q * self.total
+        acumulado = 0
+        for i, conteo in enumerate(self.conteos):
+            acumulado += conteo
+            if acumulado >= objetivo:
+                return self.buckets[i] if i < len(self.buckets) else self.maximo
+        return self.maximo
+
+class Metricas:
+    def __init__(self):
+        self.histogramas = defaultdict(Histograma)
+        self.contadores = defaultdict(int)
+
+    def observar(self, nombre, etiqueta, valor_ms):
+        self.histogramas[(nombre, etiqueta)].observar(valor_ms)
+
+    def contar(self, nombre, etiqueta="", cantidad=1):
+        self.contadores[(nombre, etiqueta)] += cantidad
+
+    def medir(self, nombre, etiqueta=None):
+        # Decorador para funciones sync o async; la etiqueta por defecto es el nombre de la funcion
+        def decorador(fn):
+            clave = etiqueta or fn.__name__
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def envoltura_async(*args, **kwargs):
+                    inicio = time.perf_counter()
+                    try:
+                        return await fn(*args, **kwargs)
+                    finally:
+                        self.observar(nombre, clave, (time.perf_counter() - inicio) * 1000)
+                return envoltura_async
+
+            @functools.wraps(fn)
+            def envoltura(*args, **kwargs):
+                inicio = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observar(nombre, clave, (time.perf_counter() - inicio) * 1000)
+            return envoltura
+        return decorador
+
+    def por_nombre(self, nombre):
+        return {etiqueta: h for (n, etiqueta), h in self.histogramas.items() if n == nombre}
+
+    # ======================
+    # EXPOSICION PROMETHEUS
+    # ======================
+    def exposicion(self, extra=None):
+        lineas = []
+        nombres = sorted({n for n, _ in self.histogramas})
+        for nombre in nombres:
+            metrica = f"bot_{nombre}_ms"
+            lineas.append(f"# TYPE {metrica} histogram")
+            for (n, etiqueta), h in sorted(self.histogramas.items()):
+                if n != nombre:
+                    continue
+                acumulado = 0
+                for limite, conteo in zip(h.buckets, h.conteos):
+                    acumulado += conteo
+                    lineas.append(f'{metrica}_bucket{{nombre="{etiqueta}",le="{limite}"}} {acumulado}')
+                lineas.append(f'{metrica}_bucket{{nombre="{etiqueta}",le="+Inf"}} {h.total}')
+                lineas.append(f'{metrica}_sum{{nombre="{etiqueta}"}} {h.suma:.3f}')
+                lineas.append(f'{metrica}_count{{nombre="{etiqueta}"}} {h.total}')
+
+        nombres = sorted({n for n, _ in self.contadores})
+        for nombre in nombres:
+            metrica = f"bot_{nombre}_total"
+            lineas.append(f"# TYPE {metrica} counter")
+            for (n, etiqueta), valor in sorted(self.contadores.items()):
+                if n == nombre:
+                    sufijo = f'{{nombre="{etiqueta}"}}' if etiqueta else ""
+                    lineas.append(f"{metrica}{sufijo} {valor}")
+
+        for nombre, valor in sorted((extra or {}).items()):
+            lineas.append(f"# TYPE bot_{nombre} gauge")
+            lineas.append(f"bot_{nombre} {valor}")
+        return "\n".join(lineas) + "\n"
+
+    async def servir(self, host, puerto, extra=lambda: {}):
+        # Endpoint HTTP minimo para que Prometheus scrapee /metrics
+        async def atender(reader, writer):
+            try:
+                pedido = await reader.readline()
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                if pedido.split(b" ")[1:2] == [b"/metrics"]:
+                    cuerpo = self.exposicion(extra()).encode("utf-8")
+                    estado = b"200 OK"
+                else:
+                    cuerpo = b"not found\n"
+                    estado = b"404 Not Found"
+                writer.write(
+                    b"HTTP/1.1 " + estado + b"\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                    + f"Content-Length: {len(cuerpo)}\r\nConnection: close\r\n\r\n".encode("ascii") + cuerpo
+                )
+                await writer.drain()
+            finally:
+                writer.close()
+        return await asyncio.start_server(atender, host, puerto)
+
+# ======================
+# LAG DEL EVENT LOOP
+# ======================
+async def muestrear_lag(metricas, intervalo=0.5):
+    while True:
+        inicio = time.perf_counter()
+        await asyncio.sleep(intervalo)
+        metricas.observar("lag_loop", "loop", max(0.0, (time.perf_counter() - inicio - intervalo) * 1000))
+
+# ======================
+# LLAMADAS REST Y 429
+# ======================
+# Cada 429 deja una linea "responded with 429" y los globales ademas otra, asi
+# que se cuentan aparte y no suman al total. Las dos son WARNING: llegan aunque
+# bot.run deje el logger de discord en INFO (la de sub-ratelimit es DEBUG y no).
+MENSAJES_429 = (
+    ("responded with 429", "rest_429"),
+    ("Global rate limit has been hit", "rest_429_global"),
+)
+
+class ContadorRateLimit(logging.Handler):
+    # discord.py reintenta los 429 por su cuenta y solo los deja en el log de
+    # discord.http, junto con otras lineas de rate limit que no son 429
+    def __init__(self, metricas):
+        super().__init__(logging.DEBUG)
+        self.metricas = metricas
+
+    def emit(self, record):
+        mensaje = record.getMessage()
+        for texto, contador in MENSAJES_429:
+            if texto in mensaje:
+                self.metricas.contar(contador)
+
+def instrumentar_http(http, metricas):
+    original = http.request
+
+    @functools.wraps(original)
+    async def request(route, **kwargs):
+        metricas.contar("rest_llamadas", f"{route.method} {route.path}")
+        inicio = time.perf_counter()
+        try:
+            return await original(route, **kwargs)
+        finally:
+            metricas.observar("rest", route.method, (time.perf_counter() - inicio) * 1000)
+
+    http.request = request
+    logging.getLogger("discord.http").addHandler(ContadorRateLimit(metricas))
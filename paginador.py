@@ -0,0 +1,93 @@
+import discord
+from collections import OrderedDict
+from discord.ui import View, Button
+from salida import PRIORIDAD_INTERACCION
+
+# ======================
+# CACHE DE PAGINAS
+# ======================
+class CachePaginas:
+    # LRU acotado de embeds ya renderizados, compartido por todos los
+    # paginadores. La clave lleva la version de los datos, asi que una pagina
+    # vieja nunca se sirve: simplemente deja de pedirse y termina desalojada.
+    def __init__(self, capacidad):
+        self.capacidad = capacidad
+        self.paginas = OrderedDict()
+        self.stats = {"aciertos": 0, "fallos": 0, "desalojos": 0}
+
+    def obtener(self, clave):
+        embed = self.paginas.get(clave)
+        if embed is None:
+            self.stats["fallos"] += 1
+            return None
+        self.paginas.move_to_end(clave)
+        self.stats["aciertos"] += 1
+        return embed
+
+    def guardar(self, clave, embed):
+        self.paginas[clave] = embed
+        self.paginas.move_to_end(clave)
+        while len(self.paginas) > self.capacidad:
+            self.paginas.popitem(last=False)
+            self.stats["desalojos"] += 1
+
+# ======================
+# PAGINADOR
+# ======================
+class FuentePaginas:
+    # Fuente perezosa: no guarda datos, solo sabe contar y renderizar una
+    # pagina (render es async y recibe el indice desde 0).
+    def __init__(self, clave, total, version, render):
+        self.clave = clave
+        self.total = total
+        self.version = version
+        self.render = render
+
+class Paginador(View):
+    def __init__(self, fuente, cache, responder, editar, timeout=180):
+        super().__init__(timeout=timeout)
+        self.fuente = fuente
+        self.cache = cache
+        self.responder = responder
+        self.editar = editar
+        self.pagina = 0
+        self.mensaje = None
+
+        self.anterior = Button(label="⬅️ Anterior", style=discord.ButtonStyle.primary)
+        self.anterior.callback = lambda interaction: self.mover(interaction, -1)
+        self.siguiente = Button(label="➡️ Siguiente", style=discord.ButtonStyle.primary)
+        self.siguiente.callback = lambda interaction: self.mover(interaction, 1)
+        self.add_item(self.anterior)
+        self.add_item(self.siguiente)
+
+    async def embed(self):
+        clave = (self.fuente.clave, self.fuente.version(), self.pagina)
+        embed = self.cache.obtener(clave)
+        if embed is None:
+            embed = await self.fuente.render(self.pagina)
+            self.cache.guardar(clave, embed)
+        return embed
+
+    async def enviar(self, ctx):
+        self.mensaje = await ctx.send(embed=await self.embed(), view=self)
+        return self.mensaje
+
+    async def mover(self, interaction, paso):
+        pagina = min(max(self.pagina + paso, 0), self.fuente.total() - 1)
+        if pagina == self.pagina:
+            await self.responder(interaction, interaction.response.defer)
+            return
+        self.pagina = pagina
+        await self.responder(interaction, interaction.response.edit_message, embed=await self.embed(), view=self)
+
+    async def on_timeout(self):
+        # Al vencer discord.py suelta la vista; se desactivan los botones para
+        # que nadie toque uno que ya no responde
+        for item in self.children:
+            item.disabled = True
+        if self.mensaje is None:
+            return
+        try:
+            await self.editar(self.mensaje, PRIORIDAD_INTERACCION, view=self)
+        except discord.HTTPException:
+            pass
@@ -0,0 +1,93 @@
+import asyncio
+import heapq
+import itertools
+from collections import Counter
+
+# Carriles de prioridad: un numero menor sale primero dentro del mismo bucket
+PRIORIDAD_INTERACCION = 0
+PRIORIDAD_ROSTER = 1
+PRIORIDAD_DECORATIVA = 2
+
+# ======================
+# PLANIFICADOR DE SALIDA
+# ======================
+class Trabajo:
+    def __init__(self, prioridad, accion, kwargs, clave):
+        self.prioridad = prioridad
+        self.accion = accion
+        self.kwargs = kwargs
+        self.clave = clave
+        self.futuros = [asyncio.get_running_loop().create_future()]
+        self.vigente = True
+
+class Planificador:
+    # Una cola por bucket de rate limit de Discord (para mensajes, reacciones
+    # e hilos el bucket es el canal). Cada bucket tiene un solo pedido en vuelo
+    # y el siguiente se elige por prioridad; las ediciones pendientes del mismo
+    # mensaje se fusionan en una sola con los kwargs mas nuevos.
+    def __init__(self):
+        self.colas = {}
+        self.pendientes = {}
+        self.workers = {}
+        self.orden = itertools.count()
+        self.stats = Counter()
+
+    def programar(self, bucket, prioridad, accion, clave=None, **kwargs):
+        self.stats["encolados"] += 1
+        previo = self.pendientes.get((bucket, clave)) if clave is not None else None
+        if previo is not None:
+            # Lo nuevo reemplaza a lo viejo, pero se conserva lo que lo viejo
+            # cambiaba y lo nuevo no toca (por ejemplo la view de un boton).
+            self.stats["reemplazados"] += 1
+            previo.kwargs.update(kwargs)
+            previo.accion = accion
+            futuro = asyncio.get_running_loop().create_future()
+            previo.futuros.append(futuro)
+            if prioridad < previo.prioridad:
+                previo.vigente = False
+                nuevo = Trabajo(prioridad, accion, previo.kwargs, clave)
+                nuevo.futuros = previo.futuros
+                self._encolar(bucket, nuevo)
+            return futuro
+
+        trabajo = Trabajo(prioridad, accion, kwargs, clave)
+        self._encolar(bucket, trabajo)
+        return trabajo.futuros[0]
+
+    def _encolar(self, bucket, trabajo):
+        if trabajo.clave is not None:
+            self.pendientes[(bucket, trabajo.clave)] = trabajo
+        heapq.heappush(self.colas.setdefault(bucket, []), (trabajo.prioridad, next(self.orden), trabajo))
+        if bucket not in self.workers:
+            self.workers[bucket] = asyncio.create_task(self._drenar(bucket))
+
+    async def enviar(self, bucket, prioridad, accion, clave=None, **kwargs):
+        return await self.programar(bucket, prioridad, accion, clave, **kwargs)
+
+    async def _drenar(self, bucket):
+        cola = self.colas[bucket]
+        try:
+            while cola:
+                _, _, trabajo = heapq.heappop(cola)
+                if not trabajo.vigente:
+                    continue
+                if trabajo.clave is not None:
+                    self.pendientes.pop((bucket, trabajo.clave), None)
+                try:
+                    resultado = await trabajo.accion(**trabajo.kwargs)
+                except Exception as e:
+                    self.stats["fallidos"] += 1
+                    for futuro in trabajo.futuros:
+                        if not futuro.done():
+                            futuro.set_exception(e)
+                            # Nadie esta obligado a esperar un pedido decorativo
+                            futuro.exception()
+                else:
+                    self.stats["ejecutados"] += 1
+                    for futuro in trabajo.futuros:
+                        if not futuro.done():
+                            futuro.set_result(resultado)
+        finally:
+            del self.workers[bucket]
+            if not cola:
+                del self.colas[bucket]
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+
+log = logging.getLogger(__name__)
+
+# ======================
+# RUEDA DE TEMPORIZADORES
+# ======================
+class RuedaTemporizadores:
+    # Rueda con hash: el tick absoluto t cae en la ranura t % ranuras y, dentro
+    # de ella, en el balde de su vuelta t // ranuras. Cada tick saca un solo
+    # balde, asi girar cuesta lo mismo con diez o diez mil timers pendientes, y
+    # programar o cancelar por clave es un acceso a dict.
+    def __init__(self, tick=1.0, ranuras=512, reloj=time.time):
+        self.tick = tick
+        self.ranuras = [{} for _ in range(ranuras)]
+        self.reloj = reloj
+        self.ubicacion = {}
+        self.actual = self._tick_de(reloj())
+        self.tarea = None
+        self.tareas = set()
+        self.stats = Counter()
+
+    def __len__(self):
+        return len(self.ubicacion)
+
+    def _tick_de(self, instante):
+        return int(instante // self.tick)
+
+    def programar(self, clave, cuando, accion):
+        # cuando es un instante del reloj (epoch en segundos); si ya paso sale
+        # en el proximo tick. La misma clave reemplaza al timer anterior.
+        self.cancelar(clave)
+        destino = max(self._tick_de(cuando), self.actual + 1)
+        ranura, vuelta = destino % len(self.ranuras), destino // len(self.ranuras)
+        self.ranuras[ranura].setdefault(vuelta, {})[clave] = accion
+        self.ubicacion[clave] = (ranura, vuelta)
+        self.stats["programados"] += 1
+
+    def cancelar(self, clave):
+        lugar = self.ubicacion.pop(clave, None)
+        if lugar is None:
+            return False
+        ranura, vuelta = lugar
+        balde = self.ranuras[ranura][vuelta]
+        del balde[clave]
+        if not balde:
+            del self.ranuras[ranura][vuelta]
+        self.stats["cancelados"] += 1
+        return True
+
+    def avanzar(self, hasta):
+        # Procesa todos los ticks hasta el instante dado; si el loop se trabo
+        # se ponen al dia de a uno, sin perder ninguno
+        objetivo = self._tick_de(hasta)
+        while self.actual < objetivo:
+            self.actual += 1
+            balde = self.ranuras[self.actual % len(self.ranuras)].pop(self.actual // len(self.ranuras), None)
+            for clave, accion in (balde or {}).items():
+                del self.ubicacion[clave]
+                self._disparar(clave, accion)
+
+    def _disparar(self, clave, accion):
+        self.stats["disparados"] += 1
+        tarea = asyncio.create_task(accion())
+        self.tareas.add(tarea)
+        tarea.add_done_callback(lambda t: self._terminada(clave, t))
+
+    def _terminada(self, clave, tarea):
+        self.tareas.discard(tarea)
+        if not tarea.cancelled() and tarea.exception() is not None:
+            self.stats["fallidos"] += 1
+            log.error("Fallo el timer %s", clave, exc_info=tarea.exception())
+
+    def iniciar(self):
+        if self.tarea is None or self.tarea.done():
+            self.tarea = asyncio.create_task(self._girar())
+        return self.tarea
+
+    async def _girar(self):
+        while True:
+            ahora = self.reloj()
+            self.avanzar(ahora)
+            # Se duerme hasta el borde del proximo tick, no un tick fijo
+            await asyncio.sleep((self.actual + 1) * self.tick - ahora)
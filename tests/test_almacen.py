@@ -0,0 +1,192 @@
+import asyncio
+import os
+
+import pytest
+
+from almacen import COLECCIONES, Almacen, BackendJSON, Cerrojo
+from libro import Libro
+
+def crear_almacen(directorio, con_libro=True):
+    archivos = {nombre: os.path.join(directorio, f"_{nombre}.json") for nombre in COLECCIONES}
+    backend = BackendJSON(archivos, os.path.join(directorio, "_historial.json"))
+    libro = Libro(os.path.join(directorio, "_movimientos")) if con_libro else None
+    return Almacen(backend, libro)
+
+def puntos(actuales):
+    return {"puntos_actuales": actuales, "puntos_obtenidos": actuales, "puntos_usados": 0}
+
+# ======================
+# CERROJO
+# ======================
+def test_compartidos_juntos_y_exclusivo_espera():
+    async def caso():
+        cerrojo = Cerrojo()
+        await cerrojo.tomar(False)
+        await cerrojo.tomar(False)
+        exclusivo = asyncio.create_task(cerrojo.tomar(True))
+        await asyncio.sleep(0)
+        assert not exclusivo.done()
+        cerrojo.soltar(False)
+        await asyncio.sleep(0)
+        assert not exclusivo.done()
+        cerrojo.soltar(False)
+        await exclusivo
+        assert cerrojo.exclusivo
+        cerrojo.soltar(True)
+        assert not cerrojo.ocupado()
+    asyncio.run(caso())
+
+def test_orden_de_llegada():
+    # Un compartido que llega detras de un exclusivo en espera no lo adelanta
+    async def caso():
+        cerrojo = Cerrojo()
+        orden = []
+        await cerrojo.tomar(False)
+
+        async def pedir(nombre, exclusivo):
+            await cerrojo.tomar(exclusivo)
+            orden.append(nombre)
+
+        exclusivo = asyncio.create_task(pedir("exclusivo", True))
+        await asyncio.sleep(0)
+        compartido = asyncio.create_task(pedir("compartido", False))
+        await asyncio.sleep(0)
+        assert orden == []
+        cerrojo.soltar(False)
+        await asyncio.sleep(0)
+        assert orden == ["exclusivo"]
+        cerrojo.soltar(True)
+        await asyncio.gather(exclusivo, compartido)
+        assert orden == ["exclusivo", "compartido"]
+    asyncio.run(caso())
+
+def test_cancelar_mientras_espera():
+    async def caso():
+        cerrojo = Cerrojo()
+        await cerrojo.tomar(True)
+        cancelado = asyncio.create_task(cerrojo.tomar(True))
+        siguiente = asyncio.create_task(cerrojo.tomar(False))
+        await asyncio.sleep(0)
+        cancelado.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelado
+        assert len(cerrojo.cola) == 1
+        cerrojo.soltar(True)
+        await siguiente
+        assert cerrojo.compartidos == 1 and not cerrojo.exclusivo
+        cerrojo.soltar(False)
+        assert not cerrojo.ocupado()
+    asyncio.run(caso())
+
+def test_cancelar_exclusivo_despierta_a_los_de_atras():
+    # Si se va el exclusivo que frenaba la cola, los compartidos pasan
+    async def caso():
+        cerrojo = Cerrojo()
+        await cerrojo.tomar(False)
+        exclusivo = asyncio.create_task(cerrojo.tomar(True))
+        await asyncio.sleep(0)
+        compartido = asyncio.create_task(cerrojo.tomar(False))
+        await asyncio.sleep(0)
+        exclusivo.cancel()
+        await asyncio.gather(exclusivo, return_exceptions=True)
+        await compartido
+        assert cerrojo.compartidos == 2
+    asyncio.run(caso())
+
+# ======================
+# TRANSACCIONES
+# ======================
+def test_rollback_de_dict_y_lista(tmp_path):
+    async def caso():
+        almacen = crear_almacen(str(tmp_path))
+        almacen.guardar("puntos", {"1": puntos(10), "2": puntos(5)})
+        almacen.guardar("bans", ["7"])
+        with pytest.raises(RuntimeError):
+            async with almacen.transaccion(puntos=["1", "3"], bans=["7", "8"]):
+                data = almacen.obtener("puntos")
+                data["1"]["puntos_actuales"] = 99
+                data["3"] = puntos(1)
+                almacen.guardar("puntos", data, ["1", "3"])
+                bans = almacen.obtener("bans")
+                bans.remove("7")
+                bans.append("8")
+                almacen.guardar("bans", bans, ["7", "8"])
+                raise RuntimeError
+        assert almacen.obtener("puntos") == {"1": puntos(10), "2": puntos(5)}
+        assert almacen.obtener("bans") == ["7"]
+        assert not almacen.cerrojos_miembro
+    asyncio.run(caso())
+
+def test_rollback_de_coleccion_entera(tmp_path):
+    async def caso():
+        almacen = crear_almacen(str(tmp_path))
+        almacen.guardar("puntos", {"1": puntos(10)})
+        with pytest.raises(RuntimeError):
+            async with almacen.transaccion(puntos=None):
+                almacen.guardar("puntos", {})
+                raise RuntimeError
+        assert almacen.obtener("puntos") == {"1": puntos(10)}
+    asyncio.run(caso())
+
+def test_transaccion_persiste_al_salir(tmp_path):
+    async def caso():
+        almacen = crear_almacen(str(tmp_path))
+        async with almacen.transaccion(puntos=["1"]):
+            data = almacen.obtener("puntos")
+            data["1"] = puntos(4)
+            almacen.guardar("puntos", data, ["1"])
+        almacen.backend.cerrar()
+        almacen.libro.cerrar()
+    asyncio.run(caso())
+    assert crear_almacen(str(tmp_path)).obtener("puntos") == {"1": puntos(4)}
+
+# ======================
+# RECUPERACION DEL LIBRO
+# ======================
+def test_linea_cortada_en_el_libro(tmp_path):
+    almacen = crear_almacen(str(tmp_path))
+    data = almacen.obtener("puntos")
+    data["1"] = puntos(3)
+    almacen.guardar("puntos", data, ["1"])
+    almacen.volcar()
+    almacen.backend.cerrar()
+    almacen.libro.cerrar()
+    # Un corte a mitad de un append deja una linea sin "\n"
+    with open(almacen.libro.segmentos()[-1], "ab") as f:
+        f.write(b'{"s":2,"t":0,"c":"puntos","u":"1","v":{"puntos_act')
+
+    almacen = crear_almacen(str(tmp_path))
+    assert almacen.obtener("puntos") == {"1": puntos(3)}
+    # La siguiente escritura recorta la linea cortada antes de agregar
+    data = almacen.obtener("puntos")
+    data["2"] = puntos(8)
+    almacen.guardar("puntos", data, ["2"])
+    almacen.volcar()
+    almacen.backend.cerrar()
+    almacen.libro.cerrar()
+
+    assert crear_almacen(str(tmp_path)).obtener("puntos") == {"1": puntos(3), "2": puntos(8)}
+
+def test_snapshot_adelante_de_su_marca(tmp_path):
+    almacen = crear_almacen(str(tmp_path))
+    data = almacen.obtener("puntos")
+    data["1"] = puntos(1)
+    almacen.guardar("puntos", data, ["1"])
+    almacen.volcar(snapshot=True)
+    data["1"] = puntos(2)
+    data["2"] = puntos(5)
+    almacen.guardar("puntos", data, ["1", "2"])
+    almacen.guardar("multas", {"9": {"deuda": 1.5, "total": 1.5, "pago": 0.0}})
+    # Corte despues de escribir el libro y las colecciones, antes de la marca
+    lote, registros, marca = almacen.preparar_volcado(snapshot=True)
+    almacen.libro.escribir(registros)
+    for nombre, copia, claves, _, _ in lote:
+        almacen.backend.escribir(nombre, copia, claves)
+    almacen.backend.cerrar()
+    almacen.libro.cerrar()
+
+    almacen = crear_almacen(str(tmp_path))
+    assert almacen.libro.snapshot < marca
+    assert almacen.obtener("puntos") == {"1": puntos(2), "2": puntos(5)}
+    assert almacen.obtener("multas") == {"9": {"deuda": 1.5, "total": 1.5, "pago": 0.0}}
+    assert almacen.libro.seq == marca
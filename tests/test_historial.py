@@ -0,0 +1,49 @@
+import struct
+
+from historial import FORMATO_OFFSET, HistorialLog
+
+def party(numero, miembros=(1, 2)):
+    return {
+        "fecha": "01/02/2026", "hora": "2000", "leader_id": 7, "descuento": numero,
+        "roles": {"healer": [{"id": uid, "nombre": str(uid)} for uid in miembros]},
+    }
+
+def test_linea_cortada_se_recorta(tmp_path):
+    base = str(tmp_path / "_historial.json")
+    log = HistorialLog(base)
+    log.agregar_lote([party(i) for i in range(3)])
+    log.cerrar()
+    with open(log.ruta_log, "ab") as f:
+        f.write(b'{"fecha": "01/02/2026", "ho')
+
+    log = HistorialLog(base)
+    assert log.contar() == 3
+    with open(log.ruta_log, "rb") as f:
+        assert f.read().endswith(b"\n")
+    log.agregar(party(3))
+    assert [log.leer(pos)["descuento"] for pos in range(4)] == [3, 2, 1, 0]
+    log.cerrar()
+
+def test_indice_atrasado_se_completa(tmp_path):
+    # Corte entre el append al log y el del indice
+    base = str(tmp_path / "_historial.json")
+    log = HistorialLog(base)
+    log.agregar_lote([party(i) for i in range(4)])
+    log.cerrar()
+    with open(log.ruta_idx, "r+b") as f:
+        f.truncate(2 * struct.calcsize(FORMATO_OFFSET))
+
+    log = HistorialLog(base)
+    assert log.contar() == 4
+    assert log.leer(0)["descuento"] == 3
+    log.cerrar()
+
+def test_filtros_siguen_los_agregados(tmp_path):
+    log = HistorialLog(str(tmp_path / "_historial.json"))
+    log.agregar(party(0, miembros=(1,)))
+    log.preparar()
+    log.agregar_lote([party(1, miembros=(1, 2)), party(2, miembros=(2,))])
+    assert log.contar(("miembro", "1")) == 2
+    assert log.leer(0, ("miembro", "2"))["descuento"] == 2
+    assert log.contar(("mes", "2026-02")) == 3
+    log.cerrar()
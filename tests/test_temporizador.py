@@ -0,0 +1,76 @@
+import asyncio
+
+from temporizador import RuedaTemporizadores
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+def test_dispara_en_orden_a_traves_de_vueltas():
+    async def caso():
+        reloj = Reloj()
+        rueda = RuedaTemporizadores(tick=1.0, ranuras=8, reloj=reloj)
+        disparados = []
+
+        def accion(nombre):
+            async def correr():
+                disparados.append(nombre)
+            return correr
+
+        # 3 y 11 caen en la misma ranura, una vuelta aparte
+        for demora in (11, 3, 20, 1):
+            rueda.programar(demora, reloj.ahora + demora, accion(demora))
+        rueda.avanzar(reloj.ahora + 5)
+        await asyncio.sleep(0)
+        assert disparados == [1, 3]
+        assert len(rueda) == 2
+        rueda.avanzar(reloj.ahora + 12)
+        await asyncio.sleep(0)
+        assert disparados == [1, 3, 11]
+        rueda.avanzar(reloj.ahora + 30)
+        await asyncio.sleep(0)
+        assert disparados == [1, 3, 11, 20]
+        assert len(rueda) == 0
+    asyncio.run(caso())
+
+def test_cancelar_y_reemplazar_por_clave():
+    async def caso():
+        reloj = Reloj()
+        rueda = RuedaTemporizadores(tick=1.0, ranuras=8, reloj=reloj)
+        disparados = []
+
+        def accion(nombre):
+            async def correr():
+                disparados.append(nombre)
+            return correr
+
+        rueda.programar("a", reloj.ahora + 2, accion("a"))
+        rueda.programar("b", reloj.ahora + 2, accion("b"))
+        # La misma clave reemplaza al timer anterior
+        rueda.programar("b", reloj.ahora + 4, accion("b2"))
+        assert rueda.cancelar("a")
+        assert not rueda.cancelar("a")
+        rueda.avanzar(reloj.ahora + 10)
+        await asyncio.sleep(0)
+        assert disparados == ["b2"]
+        assert rueda.stats["cancelados"] == 2
+        assert not any(rueda.ranuras)
+    asyncio.run(caso())
+
+def test_lo_vencido_sale_en_el_proximo_tick():
+    async def caso():
+        reloj = Reloj()
+        rueda = RuedaTemporizadores(tick=1.0, ranuras=8, reloj=reloj)
+        disparados = []
+
+        async def correr():
+            disparados.append("vencido")
+
+        rueda.programar("x", reloj.ahora - 3600, correr)
+        rueda.avanzar(reloj.ahora + 1)
+        await asyncio.sleep(0)
+        assert disparados == ["vencido"]
+    asyncio.run(caso())